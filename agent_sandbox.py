@@ -0,0 +1,192 @@
+import os
+import time
+import signal
+import resource
+import itertools
+
+from host_monitor import descendants
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CPU_PERIOD = 100000  # cpu.max period, in microseconds
+
+def own_cgroup():
+    """This process's cgroup-v2 directory, or None without the unified hierarchy."""
+    try:
+        with open("/proc/self/cgroup", "r") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    path = os.path.join(CGROUP_ROOT, line[3:].strip().lstrip("/"))
+                    if os.path.exists(os.path.join(path, "cgroup.controllers")):
+                        return path
+    except OSError:
+        pass
+    return None
+
+def _write(path, value):
+    with open(path, "w") as f:
+        f.write(value)
+
+def _signal(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def kill_tree(pid, sig=signal.SIGKILL):
+    """Signal an agent's process group and every descendant that left it (e.g. via setsid)."""
+    stray = descendants(pid)
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for child in stray:
+        _signal(child, sig)
+
+class AgentLimits:
+    """Caps on the memory, CPU and process count of each agent's whole process tree.
+
+    With cgroup v2 and a `parent` cgroup the controller may manage (by default
+    its own), each attempt gets a child cgroup with memory.max, cpu.max and
+    pids.max, and the agent joins it before exec. Otherwise the caps become
+    per-process rlimits: RLIMIT_DATA for memory (not RLIMIT_AS: Node, which
+    runs the Gemini CLI, reserves far more address space than it uses),
+    RLIMIT_CPU for `cpus` times the attempt timeout, and RLIMIT_NPROC for
+    processes. RLIMIT_NPROC counts per user, so it is set to the user's
+    current process count plus `pids`.
+    """
+
+    def __init__(self, memory_mb=None, cpus=None, pids=None, parent=None, use_cgroups=True):
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+        self.pids = pids
+        self.parent = None
+        self._ids = itertools.count(1)
+        if not self.enabled():
+            self.mode = "off"
+            return
+        self.mode = "rlimit"
+        if use_cgroups:
+            parent = parent or own_cgroup()
+            if parent is not None and self._delegate(parent):
+                self.parent = parent
+                self.mode = "cgroup"
+
+    def enabled(self):
+        return any(v is not None for v in (self.memory_mb, self.cpus, self.pids))
+
+    def _controllers(self):
+        return [name for name, value in (("memory", self.memory_mb), ("cpu", self.cpus), ("pids", self.pids))
+                if value is not None]
+
+    def _delegate(self, parent):
+        """Enable the needed controllers for children of `parent`. False if that is not permitted."""
+        try:
+            with open(os.path.join(parent, "cgroup.controllers"), "r") as f:
+                available = f.read().split()
+            wanted = self._controllers()
+            if not all(c in available for c in wanted):
+                return False
+            _write(os.path.join(parent, "cgroup.subtree_control"), " ".join("+" + c for c in wanted))
+            return True
+        except OSError:
+            # Typically EBUSY: a non-root cgroup that holds processes cannot delegate
+            return False
+
+    def sandbox(self, name, timeout):
+        """Prepare the limits of one attempt."""
+        cgroup = None
+        if self.parent is not None:
+            cgroup = os.path.join(self.parent, f"agent-{name}-{os.getpid()}-{next(self._ids)}")
+            try:
+                os.mkdir(cgroup)
+                if self.memory_mb is not None:
+                    _write(os.path.join(cgroup, "memory.max"), str(int(self.memory_mb * 1024 * 1024)))
+                    _write(os.path.join(cgroup, "memory.swap.max"), "0")
+                if self.cpus is not None:
+                    _write(os.path.join(cgroup, "cpu.max"), f"{int(self.cpus * CPU_PERIOD)} {CPU_PERIOD}")
+                if self.pids is not None:
+                    _write(os.path.join(cgroup, "pids.max"), str(self.pids))
+            except OSError:
+                try:
+                    os.rmdir(cgroup)
+                except OSError:
+                    pass
+                cgroup = None
+        return AgentSandbox(self, cgroup, timeout)
+
+class AgentSandbox:
+    """The limits of one attempt, applied to its process between fork and exec."""
+
+    def __init__(self, limits, cgroup, timeout):
+        self.limits = limits
+        self.cgroup = cgroup
+        self.rlimits = [] if cgroup is not None else self._rlimits(timeout)
+
+    def _rlimits(self, timeout):
+        limits = []
+        if self.limits.memory_mb is not None:
+            size = int(self.limits.memory_mb * 1024 * 1024)
+            limits.append((resource.RLIMIT_DATA, size))
+        if self.limits.cpus is not None and timeout:
+            limits.append((resource.RLIMIT_CPU, max(1, int(self.limits.cpus * timeout))))
+        if self.limits.pids is not None:
+            uid = os.getuid()
+            running = 0
+            for entry in os.listdir("/proc"):
+                try:
+                    running += entry.isdigit() and os.stat(f"/proc/{entry}").st_uid == uid
+                except OSError:
+                    continue
+            limits.append((resource.RLIMIT_NPROC, running + self.limits.pids))
+        return limits
+
+    def preexec(self):
+        """Runs in the child after fork: join the cgroup or lower the rlimits."""
+        # Only plain system calls here: other threads of the controller may hold locks
+        if self.cgroup is not None:
+            fd = os.open(os.path.join(self.cgroup, "cgroup.procs"), os.O_WRONLY)
+            try:
+                os.write(fd, b"0")
+            finally:
+                os.close(fd)
+        for which, value in self.rlimits:
+            _, hard = resource.getrlimit(which)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.setrlimit(which, (value, hard))
+
+    def members(self):
+        try:
+            with open(os.path.join(self.cgroup, "cgroup.procs"), "r") as f:
+                return [int(pid) for pid in f.read().split()]
+        except (OSError, ValueError):
+            return []
+
+    def kill(self, pid, sig=signal.SIGKILL):
+        """Signal the whole agent: its cgroup if it has one, else its process tree."""
+        if self.cgroup is None:
+            kill_tree(pid, sig)
+            return
+        if sig == signal.SIGKILL:
+            try:
+                _write(os.path.join(self.cgroup, "cgroup.kill"), "1")
+                return
+            except OSError:
+                pass  # cgroup.kill needs Linux 5.14
+        for member in self.members():
+            _signal(member, sig)
+
+    def close(self):
+        """Kill whatever is left in the attempt's cgroup and remove it."""
+        if self.cgroup is None:
+            return
+        self.kill(None)
+        for _ in range(50):
+            try:
+                os.rmdir(self.cgroup)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # Killed members take a moment to leave the cgroup
+                time.sleep(0.02)
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+
+from hedging import exchange_dirs
+
+BATCH_MAX_COST = 120  # Expected seconds above which a project with history always runs alone
+
+def batchable(project, fresh, has_dependents, cost=None, max_cost=BATCH_MAX_COST):
+    """Whether a project may share an agent with others.
+
+    Only fresh, independent projects qualify: a resumed project needs its own
+    resumption prompt, and dependency edges need per-project ordering. A
+    project may opt out with `"batch": false` in projects.json, and one whose
+    history says it is not small (`cost` over `max_cost`) runs alone.
+    """
+    if not project.get("batch", True) or not fresh or has_dependents or project.get("depends_on"):
+        return False
+    return cost is None or cost <= max_cost
+
+def batch_workspace(scratch_root, names):
+    """Create a scratch directory with one empty sub-directory per project and return it."""
+    os.makedirs(scratch_root, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix="batch-", dir=scratch_root)
+    for name in names:
+        os.mkdir(os.path.join(workspace, name))
+    return workspace
+
+def collect(subdir, project_dir):
+    """Move a project's finished sub-directory into place (the project directory is empty)."""
+    exchange_dirs(project_dir, subdir)
+    shutil.rmtree(subdir, ignore_errors=True)
@@ -0,0 +1,102 @@
+"""Microbenchmark: the compiled line classifier against the old per-pattern loops.
+
+Usage: python3 bench_classifier.py [log_file] [--repeat N]
+
+Lines are the messages of controller.log (or a synthetic sample when the log
+is empty). Both sides do the same work per line: find the step, and check for
+a rate limit.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+
+from line_classifier import LineClassifier, default_classifier
+from rate_limiter import RATE_LIMIT_PATTERNS
+
+LEGACY_STEP_PATTERNS = [
+    r"(I will\s+.*?\.($|\s))",
+    r"(I'll\s+.*?\.($|\s))",
+    r"(Creating\s+.*)",
+    r"(Reading\s+.*)",
+    r"(Writing\s+.*)",
+    r"(Running\s+.*)",
+    r"(Executing\s+.*)",
+    r"(Analyzing\s+.*)",
+    r"(Searching\s+.*)"
+]
+
+SAMPLE_LINES = [
+    "I will create the index.html file for the landing page.",
+    "Creating styles.css with the color palette",
+    "Loaded cached credentials.",
+    "Error: 429 Too Many Requests",
+    "The page now has a header, a hero section and a footer",
+    "Running npx prettier --write index.html",
+    "Traceback (most recent call last):",
+    "Done."
+]
+
+def legacy_extract_step(line):
+    line = line.strip()
+    for p in LEGACY_STEP_PATTERNS:
+        match = re.search(p, line, re.IGNORECASE)
+        if match:
+            return match.group(1).strip()
+    return None
+
+def legacy_check_rate_limit(line):
+    for p in RATE_LIMIT_PATTERNS:
+        if re.search(p, line, re.IGNORECASE):
+            return True
+    return False
+
+def load_lines(path):
+    lines = []
+    try:
+        with open(path, "r") as f:
+            for raw in f:
+                try:
+                    message = json.loads(raw).get("message", "")
+                except json.JSONDecodeError:
+                    continue
+                lines.extend(l.strip() for l in message.splitlines() if l.strip())
+    except OSError:
+        pass
+    return lines or SAMPLE_LINES * 100
+
+def bench(fn, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    return best / len(lines) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the line classifier")
+    parser.add_argument("log_file", nargs="?", default="controller.log")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    lines = load_lines(args.log_file)
+    classifier = default_classifier()
+
+    # Both implementations must agree before their speed is compared
+    for line in lines:
+        found = classifier.classify(line)
+        if found.get("step") != legacy_extract_step(line) or ("rate_limit" in found) != legacy_check_rate_limit(line):
+            print(f"Mismatch on: {line!r}")
+            sys.exit(1)
+
+    legacy = bench(lambda l: (legacy_extract_step(l), legacy_check_rate_limit(l)), lines, args.repeat)
+    compiled = bench(classifier.classify, lines, args.repeat)
+    print(f"{len(lines)} lines, best of {args.repeat}")
+    print(f"legacy   : {legacy:6.2f} us/line")
+    print(f"compiled : {compiled:6.2f} us/line (also finds error markers)")
+    print(f"speedup  : {legacy / compiled:.1f}x")
+
+if __name__ == "__main__":
+    main()
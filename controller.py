@@ -1,18 +1,35 @@
 import os
 import json
+import asyncio
 import subprocess
 import sys
 import argparse
-import re
 import time
 import random
+import heapq
+import itertools
 import threading
 import tempfile
+import shutil
+import queue
+import atexit
+import signal
 from datetime import datetime
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from rich.live import Live
-from rich.table import Table
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
+from state_store import StateStore, STATE_DB
+from run_journal import RunJournal, new_run_id, replay
+from result_cache import ResultCache, cache_key, CACHE_DIR, CACHE_MAX_MB
+from fs_watch import ProjectWatcher
+from line_classifier import classify
+from loop_detector import LoopDetector
+from hedging import Hedger, percentile, scratch_copy, exchange_dirs, HEDGE_PERCENTILE, HEDGE_MIN_PEERS, HEDGE_BUDGET
+from host_monitor import HostMonitor, MAX_LOAD_PER_CPU, MIN_FREE_MB
+from agent_sandbox import AgentLimits, kill_tree
+from timeouts import TimeoutPolicy, MAX_TIMEOUT
+from batching import batchable, batch_workspace, collect, BATCH_MAX_COST
+from project_graph import dependencies, topological_order, downstream_costs
+from rate_limiter import SharedTokenBucket, BUCKET_FILE, LAUNCH_RATE, LAUNCH_BURST, SHARED_BACKOFF
 
 # Dynamic path resolution
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -24,12 +41,47 @@ INSTRUCTIONS_FILE = os.path.join(BASE_DIR, "subagent_instructions.txt")
 # Configuration
 EXECUTION_TIMEOUT = 300  # 5 minutes per agent
 MAX_BACKOFF = 60
+MAX_RETRIES = 5  # Rate-limit retries per project
+IDLE_TIMEOUT = 120  # Kill an agent that prints nothing on STDOUT/STDERR for this long
+EARLY_STOP_GRACE = 30  # Seconds a verified output must stay unchanged before the agent is stopped (0 disables)
+WATCH_INTERVAL = 1.0  # Seconds between checks of an active project directory
+STREAM_LIMIT = 1024 * 1024  # Longest single output line accepted from an agent
+PROBE_INTERVAL = 60  # Quiet seconds before the concurrency limit probes upward
+RATE_LIMIT_COOLDOWN = 10  # Rate limits within this window count as one signal
+LOG_QUEUE_SIZE = 10000  # Log lines buffered before producers block
+LOG_FLUSH_INTERVAL = 1.0  # Seconds between flushes of the log sink
+DASHBOARD_FPS = 4  # Dashboard redraws per second, at most
+DASHBOARD_ROWS = 40  # Rows shown before the table collapses to a window plus totals
+SUMMARY_INTERVAL = 30  # Seconds between summary events in --headless mode
+SCHEDULING_POLICY = "fifo"  # Order within a priority class: fifo, sjf (shortest expected first) or ljf
+SCHEDULING_POLICIES = ("fifo", "sjf", "ljf")
+ADAPTIVE_TIMEOUTS = False  # Learn per-project timeout and idle budgets from past attempts
+ADAPTIVE_MAX_TIMEOUT = MAX_TIMEOUT  # Ceiling of a learned timeout
+BATCH_SIZE = 1  # Small projects per agent invocation (1 disables batching)
+LOOP_KILL_REPEATS = 10  # Back-to-back repeats of an output cycle after which an agent is stopped (0 disables)
+
+# Loop prevention and resumption instructions
+SYSTEM_GUIDELINES = """
+- DO NOT get stuck in an infinite loop. If you are repeating the same action or hitting the same error, stop, analyze why, and try a different approach.
+- If files already exist, ANALYZE them first and CONTINUE the work. Do not overwrite everything unless necessary.
+- ALWAYS check for a README.md or PLAN.md to understand the previous state.
+"""
 
 # Shared state for UI and concurrency
 project_status = {}
-concurrency_semaphore = None
-current_max_workers = 2
-concurrency_lock = threading.Lock()
+concurrency = None
+init_lock = threading.Lock()
+log_writer = None
+io_loop = None
+rate_bucket = None
+state_store = None
+run_journal = None
+result_cache = None
+hedger = None
+host_monitor = None
+agent_limits = None
+shared_rate_events = None
+shared_backoff = SHARED_BACKOFF
 
 def atomic_write(file_path, content):
     """Write content to a file atomically using a temporary file."""
@@ -44,6 +96,69 @@ def atomic_write(file_path, content):
             os.remove(temp_path)
         raise e
 
+class LogWriter:
+    """Background sink that batches structured log lines into a single open file.
+
+    Producers only enqueue; one thread drains the bounded queue, writes whole
+    batches and flushes (optionally fsyncing) every `flush_interval` seconds.
+    When the queue is full, producers block rather than drop telemetry.
+    """
+    _STOP = object()
+
+    def __init__(self, path, flush_interval=LOG_FLUSH_INTERVAL, fsync=False, max_queue=LOG_QUEUE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        self._file = open(self.path, "a", buffering=64 * 1024)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def write(self, line):
+        self.queue.put(line)
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _run(self):
+        last_flush = time.time()
+        stopping = False
+        while not stopping:
+            timeout = max(0, self.flush_interval - (time.time() - last_flush))
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+                # Drain whatever else is ready so it goes out in one write
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch and batch[-1] is self._STOP:
+                batch.pop()
+                stopping = True
+            if batch:
+                self._file.write("".join(batch))
+            if stopping or time.time() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.time()
+        self._file.close()
+
+    def close(self):
+        """Flush everything queued so far and stop the writer. Safe to call twice."""
+        if self._closed or self._thread is None:
+            return
+        self._closed = True
+        self.queue.put(self._STOP)
+        self._thread.join()
+
 def log(message, level="INFO", project=None):
     """Structured logging."""
     entry = {
@@ -52,14 +167,41 @@ def log(message, level="INFO", project=None):
         "project": project,
         "message": message
     }
+    line = json.dumps(entry) + "\n"
+    writer = log_writer
+    if writer is not None and not writer._closed:
+        writer.write(line)
+        return
     with open(LOG_FILE, "a") as f:
-        f.write(json.dumps(entry) + "\n")
+        f.write(line)
+
+def journal(event, **fields):
+    """Append a scheduler event to the run journal, if this run keeps one."""
+    if run_journal is not None:
+        run_journal.append(event, **fields)
+
+def get_state_store():
+    global state_store
+    with init_lock:
+        if state_store is None:
+            state_store = StateStore(STATE_DB)
+    return state_store
 
 def is_project_complete(project_dir):
-    """Check if the project has already been completed successfully."""
-    if os.path.exists(os.path.join(project_dir, ".done")):
+    """Check if the project has already been completed successfully.
+
+    The state store answers in O(1). Projects it has never seen fall back to the
+    legacy `.done` marker or an integrity check, and the answer is recorded.
+    """
+    name = os.path.basename(project_dir)
+    store = get_state_store()
+    row = store.get(name)
+    if row is not None:
+        return row["status"] == "Done"
+    if os.path.exists(os.path.join(project_dir, ".done")) or verify_integrity(project_dir):
+        store.set_status(name, "Done", step="Imported (already complete)")
         return True
-    return verify_integrity(project_dir)
+    return False
 
 def verify_integrity(project_dir):
     """Check if the project looks complete (has index.html with a body)."""
@@ -74,62 +216,186 @@ def verify_integrity(project_dir):
             pass
     return False
 
-def mark_project_done(project_dir):
+def mark_project_done(project_dir, step=None):
     """Mark the project as completed successfully."""
-    done_file = os.path.join(project_dir, ".done")
-    atomic_write(done_file, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    get_state_store().set_status(os.path.basename(project_dir), "Done", step=step)
 
 def extract_step(line):
     """Try to extract a concise 'current step' from the agent's output."""
-    line = line.strip()
-    # Patterns common in Gemini CLI output when planning/acting
-    # Updated to handle potential dots in filenames better
-    patterns = [
-        r"(I will\s+.*?\.($|\s))",
-        r"(I'll\s+.*?\.($|\s))",
-        r"(Creating\s+.*)",
-        r"(Reading\s+.*)",
-        r"(Writing\s+.*)",
-        r"(Running\s+.*)",
-        r"(Executing\s+.*)",
-        r"(Analyzing\s+.*)",
-        r"(Searching\s+.*)"
-    ]
-    for p in patterns:
-        match = re.search(p, line, re.IGNORECASE)
-        if match:
-            return match.group(1).strip()
-    return None
+    return classify(line.strip()).get("step")
 
 def check_rate_limit(line):
     """Check if the line indicates a rate limit or quota exhaustion."""
-    rate_limit_patterns = [
-        r"exhausted your capacity",
-        r"rate limit reached",
-        r"quota exceeded",
-        r"429 Too Many Requests",
-        r"Resource exhausted"
-    ]
-    for p in rate_limit_patterns:
-        if re.search(p, line, re.IGNORECASE):
+    return "rate_limit" in classify(line)
+
+class Waitable:
+    """Condition shared by threads and asyncio tasks.
+
+    Threads block on the condition; coroutines park a future that is resolved
+    (thread-safely) on every notify. Subclasses mutate state under `_cond` and
+    call `_notify_locked()` when waiters should re-check.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    def _notify_locked(self):
+        self._cond.notify_all()
+        for fut in self._async_waiters:
+            fut.get_loop().call_soon_threadsafe(_resolve_waiter, fut)
+        self._async_waiters.clear()
+
+    def _add_async_waiter_locked(self):
+        fut = asyncio.get_running_loop().create_future()
+        self._async_waiters.append(fut)
+        return fut
+
+    @staticmethod
+    async def _wait_async(fut, timeout):
+        try:
+            await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def _resolve_waiter(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+class ConcurrencyController(Waitable):
+    """AIMD admission control for agent slots.
+
+    A rate limit cuts the limit multiplicatively, at most once per `cooldown`
+    seconds so that one burst of 429s counts as a single signal. Once the
+    controller is saturated and `probe_interval` seconds have passed without a
+    rate limit or another change, the limit grows by one, up to `max_limit`.
+    Shrinking never revokes running slots; new admissions simply wait until
+    the in-flight count drops below the new limit.
+
+    With a `host` monitor, a free slot is only granted while the host has room
+    for another agent (the first agent is always admitted), and the limit
+    does not probe upward while the host is saturated.
+    """
+
+    def __init__(self, initial, max_limit=None, min_limit=1, decrease_factor=0.5,
+                 probe_interval=PROBE_INTERVAL, cooldown=RATE_LIMIT_COOLDOWN, host=None):
+        super().__init__()
+        self.host = host
+        self.host_blocked = None
+        self.limit = max(min_limit, initial)
+        self.max_limit = max(self.limit, max_limit or initial)
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.probe_interval = probe_interval
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_change = time.time()
+        self.last_rate_limit = 0
+        self.last_reason = "initial"
+        self.history = deque(maxlen=100)
+
+    def _set_limit_locked(self, new_limit, reason):
+        old = self.limit
+        self.limit = new_limit
+        self.last_change = time.time()
+        self.last_reason = reason
+        self.history.append({"timestamp": self.last_change, "old": old, "new": new_limit,
+                             "in_flight": self.in_flight, "reason": reason})
+        log(f"Adjusting concurrency: {old} -> {new_limit} ({reason}, in flight: {self.in_flight})")
+        journal("concurrency", limit=new_limit, reason=reason)
+        self._notify_locked()
+
+    def _host_check_locked(self):
+        """Why the host cannot take another agent now, or None. Logs transitions."""
+        reason = None
+        if self.host is not None and self.in_flight > 0:
+            reason = self.host.saturated()
+        if reason and not self.host_blocked:
+            log(f"Host saturated ({reason}); holding new agents back.", level="WARNING")
+        elif self.host_blocked and not reason:
+            log("Host has room again; admitting agents.")
+        self.host_blocked = reason
+        return reason
+
+    def _can_admit_locked(self):
+        return self.in_flight < self.limit and not self._host_check_locked()
+
+    def _wait_interval(self):
+        # Re-sample a saturated host sooner than the probe interval
+        if self.host_blocked:
+            return min(self.probe_interval, self.host.interval)
+        return self.probe_interval
+
+    def _maybe_increase_locked(self, now):
+        if self.limit >= self.max_limit or self.in_flight < self.limit:
+            return
+        quiet_for = now - max(self.last_change, self.last_rate_limit)
+        if quiet_for >= self.probe_interval and not self._host_check_locked():
+            self._set_limit_locked(self.limit + 1, f"probe after {quiet_for:.0f}s without rate limits")
+
+    def on_rate_limit(self):
+        """Multiplicative decrease. Returns True if the limit actually changed."""
+        with self._cond:
+            now = time.time()
+            in_cooldown = now - self.last_rate_limit < self.cooldown
+            self.last_rate_limit = now
+            new_limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+            if in_cooldown or new_limit == self.limit:
+                return False
+            self._set_limit_locked(new_limit, "rate limit")
             return True
-    return False
 
-def adjust_concurrency(delta):
-    """Adjust the number of concurrent agents."""
-    global current_max_workers, concurrency_semaphore
-    with concurrency_lock:
-        new_val = max(1, current_max_workers + delta)
-        if new_val != current_max_workers:
-            log(f"Adjusting concurrency: {current_max_workers} -> {new_val}")
-            if delta > 0:
-                for _ in range(new_val - current_max_workers):
-                    concurrency_semaphore.release()
-            else:
-                for _ in range(current_max_workers - new_val):
-                    # We don't block here, just try to acquire to reduce future capacity
-                    concurrency_semaphore.acquire(blocking=False)
-            current_max_workers = new_val
+    def acquire(self):
+        with self._cond:
+            while True:
+                self._maybe_increase_locked(time.time())
+                if self._can_admit_locked():
+                    break
+                # Wake up periodically so a quiet period can raise the limit
+                self._cond.wait(timeout=self._wait_interval())
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        while True:
+            with self._cond:
+                self._maybe_increase_locked(time.time())
+                if self._can_admit_locked():
+                    self.in_flight += 1
+                    return
+                fut = self._add_async_waiter_locked()
+            await self._wait_async(fut, self._wait_interval())
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now."""
+        with self._cond:
+            if self._can_admit_locked():
+                self.in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._notify_locked()
+
+    def snapshot(self):
+        with self._cond:
+            return {"limit": self.limit, "max_limit": self.max_limit,
+                    "in_flight": self.in_flight, "last_reason": self.last_reason, "host_blocked": self.host_blocked}
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
 
 def get_subagent_instructions():
     if os.path.exists(INSTRUCTIONS_FILE):
@@ -137,34 +403,27 @@ def get_subagent_instructions():
             return f.read().strip()
     return ""
 
-def run_agent(project, update_ui_cb, max_retries=5):
-    name = project["name"]
-    task = project["task"]
-    project_dir = os.path.join(PROJECTS_DIR, name)
-    os.makedirs(project_dir, exist_ok=True)
-    
-    if is_project_complete(project_dir):
-        log(f"Project already complete. Skipping.", project=name)
-        project_status[name] = {"status": "Done", "step": "Skipped (Already Complete)", "progress": 100}
-        update_ui_cb()
-        return
-
-    project_status[name] = {"status": "Starting", "step": "Initializing...", "progress": 0}
-    update_ui_cb()
+def existing_project_files(project_dir):
+    return [f for f in os.listdir(project_dir) if f not in [".done", ".gemini", "__pycache__", ".git"]]
 
+def guidelines_block():
     # Load custom instructions for the sub-agent
     extra_instructions = get_subagent_instructions()
-    
-    # Loop prevention and resumption instructions
-    system_guidelines = """
-- DO NOT get stuck in an infinite loop. If you are repeating the same action or hitting the same error, stop, analyze why, and try a different approach.
-- If files already exist, ANALYZE them first and CONTINUE the work. Do not overwrite everything unless necessary.
-- ALWAYS check for a README.md or PLAN.md to understand the previous state.
-"""
-    instruction_block = f"\n\nIMPORTANT GUIDELINES:\n{system_guidelines}\n{extra_instructions}"
+    return f"\n\nIMPORTANT GUIDELINES:\n{SYSTEM_GUIDELINES}\n{extra_instructions}"
+
+def build_command(project, project_dir):
+    """Build the Gemini CLI command for a project, adding resumption context if needed."""
+    name = project["name"]
+    task = project["task"]
+
+    instruction_block = guidelines_block()
+    upstream = dependencies(project)
+    if upstream:
+        paths = ", ".join(os.path.join(PROJECTS_DIR, dep) for dep in upstream)
+        instruction_block += f"\nThis project builds on the finished output of other projects. Read (do not modify) them at: {paths}"
 
     # Check for existing files to determine if we are resuming
-    existing_files = [f for f in os.listdir(project_dir) if f not in [".done", ".gemini", "__pycache__", ".git"]]
+    existing_files = existing_project_files(project_dir)
     is_resume = len(existing_files) > 0
     
     if is_resume:
@@ -184,156 +443,1250 @@ def run_agent(project, update_ui_cb, max_retries=5):
         # We add a preamble to the prompt to encourage planning
         full_prompt = f"START NEW PROJECT: {task}. First, create a simple README.md outlining your plan. Then implement the task. {instruction_block}"
 
-    command = ["gemini", "--yolo", "-p", full_prompt]
-    
-    retries = 0
-    while retries <= max_retries:
-        with concurrency_semaphore:
-            log(f"Starting agent (Attempt {retries + 1})", project=name)
-            project_status[name]["status"] = "Running"
-            project_status[name]["step"] = f"Attempt {retries + 1}..."
-            update_ui_cb()
+    return ["gemini", "--yolo", "-p", full_prompt]
+
+def build_batch_command(jobs):
+    """One Gemini CLI command for several fresh projects, each in a sub-directory named after it."""
+    tasks = "\n".join(f"- {job.name}/: {job.project['task']}" for job in jobs)
+    full_prompt = (f"BATCH OF {len(jobs)} INDEPENDENT PROJECTS: Each project below has its own sub-directory of the "
+                   f"current directory, named after it. Keep every file of a project inside its sub-directory and never "
+                   f"touch another project's. Finish one project completely before starting the next. For each, first "
+                   f"create a simple README.md in its sub-directory outlining your plan, then implement the task.\n"
+                   f"{tasks}{guidelines_block()}")
+    return ["gemini", "--yolo", "-p", full_prompt]
+
+def prepare_project(project, update_ui_cb):
+    """Create the project directory and return it, or None if the project is already complete."""
+    name = project["name"]
+    project_dir = os.path.join(PROJECTS_DIR, name)
+    os.makedirs(project_dir, exist_ok=True)
+
+    if is_project_complete(project_dir):
+        log(f"Project already complete. Skipping.", project=name)
+        project_status[name] = {"status": "Done", "step": "Skipped (Already Complete)", "progress": 100}
+        update_ui_cb()
+        return None
+
+    project_status[name] = {"status": "Starting", "step": "Initializing...", "progress": 0}
+    update_ui_cb()
+    return project_dir
+
+def start_attempt(job, update_ui_cb):
+    name = job.name
+    log(f"Starting agent (Attempt {job.retries + 1})", project=name)
+    project_status[name]["status"] = "Running"
+    project_status[name]["step"] = f"Attempt {job.retries + 1}..."
+    job.attempt_id = get_state_store().start_attempt(name, job.retries + 1)
+    journal("attempt_start", project=name, attempt=job.retries + 1)
+    update_ui_cb()
+
+def handle_output_line(name, line, update_ui_cb, members=None):
+    """Log one line of agent STDOUT and update progress. Returns the markers found in it.
+    A batch agent's progress goes to the `members` the line names, or to all of them."""
+    line_stripped = line.strip()
+    if line_stripped:
+        log(line_stripped, project=name)
+
+    found = classify(line_stripped)
+    if "rate_limit" in found:
+        log("Rate limit detected in STDOUT.", level="WARNING", project=name)
 
+    step = found.get("step")
+    if step:
+        members = members or [name]
+        for member in [m for m in members if m in line_stripped] or members:
+            project_status[member]["step"] = step[:100] + "..." if len(step) > 100 else step
+            project_status[member]["progress"] = min(95, project_status[member]["progress"] + 10)
+        update_ui_cb()
+    return found
+
+def handle_stderr(name, stderr_output, is_rate_limited=False, error_lines=0):
+    """Log the collected agent STDERR. Its lines were already classified as they arrived."""
+    if stderr_output:
+        log(stderr_output.strip(), level="ERROR", project=name)
+    if is_rate_limited:
+        log("Rate limit detected in STDERR.", level="WARNING", project=name)
+    if error_lines:
+        log(f"Agent output carried {error_lines} error marker(s).", level="WARNING", project=name)
+
+def mark_timed_out(name, message, update_ui_cb):
+    log(message, level="WARNING", project=name)
+    project_status[name]["status"] = "Timed Out"
+    update_ui_cb()
+
+def kill_process_group(pid, sig=signal.SIGKILL):
+    """Signal whatever is left in an agent's session after the agent itself has exited."""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class AgentAttempt:
+    """One agent process: drains STDOUT and STDERR concurrently on an event loop and
+    enforces the wall-clock and idle-output timeouts even when the agent is silent."""
+
+    def __init__(self, name, project_dir, command, update_ui_cb, timeout=None, idle_timeout=None, early_stop_grace=None,
+                 members=None):
+        self.name = name
+        self.members = members  # Projects a batch agent works on; None for a single project
+        self.project_dir = project_dir
+        self.command = command
+        self.update_ui_cb = update_ui_cb
+        self.timeout = EXECUTION_TIMEOUT if timeout is None else timeout
+        self.idle_timeout = IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.early_stop_grace = EARLY_STOP_GRACE if early_stop_grace is None else early_stop_grace
+        self.returncode = None
+        self.timed_out = False
+        self.completed_early = False
+        self.verified_since = None
+        self.is_rate_limited = False
+        self.stderr_rate_limited = False
+        self.error_lines = 0
+        self.stop_reason = None
+        self.stderr_lines = []
+        self.start_time = None
+        self.last_output = None
+        self.process = None
+        self.sandbox = None
+        self.stopped = False
+        self.max_idle = 0.0
+        self.looped = False
+        self.loop_detector = LoopDetector(repeats=LOOP_KILL_REPEATS) if LOOP_KILL_REPEATS > 0 else None
+
+    def check_loop(self, line):
+        """Stop the agent as soon as its output keeps cycling through the same (near-identical) lines."""
+        if self.loop_detector is None or self.looped:
+            return
+        loop = self.loop_detector.feed(line)
+        if loop is None:
+            return
+        self.looped = True
+        self.stop_reason = f"Output repeated a {loop['period']}-line cycle {loop['repeats']} times"
+        log(f"Stopping agent: {self.stop_reason}: {' | '.join(loop['lines'])}", level="WARNING", project=self.name)
+        if self.process is not None and self.process.returncode is None:
+            self.kill()
+
+    def on_stdout(self, line):
+        self.check_loop(line)
+        found = handle_output_line(self.name, line, self.update_ui_cb, self.members)
+        if "rate_limit" in found:
+            self.is_rate_limited = True
+        if "error" in found:
+            self.error_lines += 1
+
+    def on_stderr(self, line):
+        self.check_loop(line)
+        self.stderr_lines.append(line)
+        # Classify as lines arrive instead of rescanning the whole blob at exit
+        found = classify(line)
+        if "rate_limit" in found:
+            self.stderr_rate_limited = True
+            self.is_rate_limited = True
+        if "error" in found:
+            self.error_lines += 1
+
+    def stop(self, reason):
+        """Kill the agent from outside the run loop, e.g. when its hedge twin won."""
+        self.stopped = True
+        self.stop_reason = reason
+        if self.process is not None and self.process.returncode is None:
+            self.kill()
+
+    def kill(self, sig=signal.SIGKILL):
+        """Signal the running agent with its whole process tree, including
+        children that started their own session."""
+        if self.sandbox is not None:
+            self.sandbox.kill(self.process.pid, sig)
+        else:
+            kill_tree(self.process.pid, sig)
+
+    def next_deadline(self):
+        return min(self.start_time + self.timeout, self.last_output + self.idle_timeout)
+
+    def check_deadlines(self, now):
+        """Return why the attempt must be stopped now, or None."""
+        if now - self.start_time >= self.timeout:
+            return f"Timed out after {self.timeout}s"
+        if now - self.last_output >= self.idle_timeout:
+            return f"No output for {self.idle_timeout}s"
+        return None
+
+    def output_stable(self, watcher, now):
+        """Re-check integrity when the project changed; True once it has passed
+        and stayed untouched for the grace period."""
+        if watcher.changed():
+            self.verified_since = now if verify_integrity(self.project_dir) else None
+        return self.verified_since is not None and now - self.verified_since >= self.early_stop_grace
+
+    async def _pump(self, stream, on_line):
+        while True:
             try:
-                start_time = time.time()
-                process = subprocess.Popen(
-                    command,
-                    cwd=project_dir,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
-                )
-                
-                is_rate_limited = False
-                
-                for line in process.stdout:
-                    if time.time() - start_time > EXECUTION_TIMEOUT:
-                        process.kill()
-                        log(f"Timed out after {EXECUTION_TIMEOUT}s", level="WARNING", project=name)
-                        project_status[name]["status"] = "Timed Out"
-                        update_ui_cb()
-                        break
-
-                    line_stripped = line.strip()
-                    if line_stripped:
-                        log(line_stripped, project=name)
-                    
-                    if check_rate_limit(line_stripped):
-                        is_rate_limited = True
-                        log("Rate limit detected in STDOUT.", level="WARNING", project=name)
-
-                    step = extract_step(line_stripped)
-                    if step:
-                        project_status[name]["step"] = step[:100] + "..." if len(step) > 100 else step
-                        project_status[name]["progress"] = min(95, project_status[name]["progress"] + 10)
-                        update_ui_cb()
-
-                process.wait(timeout=10) # Small grace period for final cleanup
-                
-                # Read stderr for logs and rate limits
-                stderr_output = process.stderr.read()
-                if stderr_output:
-                    log(stderr_output.strip(), level="ERROR", project=name)
-                    if check_rate_limit(stderr_output):
-                        is_rate_limited = True
-                        log("Rate limit detected in STDERR.", level="WARNING", project=name)
-
-                if project_status[name]["status"] == "Timed Out":
-                    # Even on timeout, check if it's actually done
-                    if verify_integrity(project_dir):
-                        project_status[name]["status"] = "Done"
-                        project_status[name]["step"] = "Task Completed (Detected after Timeout)"
-                        project_status[name]["progress"] = 100
-                        mark_project_done(project_dir)
-                        log("Task completed (detected after timeout).", project=name)
-                        break
-                elif is_rate_limited or process.returncode != 0:
-                    # Check if it's actually done despite the error/rate limit
-                    if verify_integrity(project_dir):
-                        project_status[name]["status"] = "Done"
-                        project_status[name]["step"] = "Task Completed (Detected after Error)"
-                        project_status[name]["progress"] = 100
-                        mark_project_done(project_dir)
-                        log("Task completed (detected after error).", project=name)
-                        break
-
-                    error_type = "RateLimit" if is_rate_limited else "FatalError"
-                    log(f"Agent failed. Type: {error_type}, Code: {process.returncode}", level="ERROR", project=name)
-                    
-                    if is_rate_limited:
-                        adjust_concurrency(-1) # Reduce concurrency on rate limit
-                        retries += 1
-                        if retries <= max_retries:
-                            wait_time = min(MAX_BACKOFF, (2 ** retries) + random.random() * 5)
-                            log(f"Retrying in {wait_time:.2f}s...", project=name)
-                            project_status[name]["status"] = "Retrying"
-                            project_status[name]["step"] = f"Rate limited. Waiting {wait_time:.2f}s"
-                            update_ui_cb()
-                            time.sleep(wait_time)
-                            continue
-                    
-                    project_status[name]["status"] = "Failed"
-                    project_status[name]["step"] = f"Exit Code: {process.returncode}"
+                raw = await stream.readline()
+            except ValueError:
+                # Line longer than STREAM_LIMIT; the reader already discarded it
+                continue
+            if not raw:
+                return
+            now = time.time()
+            self.max_idle = max(self.max_idle, now - self.last_output)
+            self.last_output = now
+            on_line(raw.decode(errors="replace"))
+
+    async def _wait_exit(self, timeout):
+        """Wait up to timeout for the agent itself to exit. Process.wait() would
+        also wait for its pipes, which children it leaves behind may hold open."""
+        deadline = time.time() + timeout
+        while self.process.returncode is None and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        return self.process.returncode is not None
+
+    async def run(self):
+        self.start_time = self.last_output = time.time()
+        if agent_limits is not None and agent_limits.enabled():
+            self.sandbox = agent_limits.sandbox(self.name, self.timeout)
+        process = await asyncio.create_subprocess_exec(
+            *self.command,
+            cwd=self.project_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            start_new_session=True,
+            preexec_fn=self.sandbox.preexec if self.sandbox is not None else None
+        )
+        self.process = process
+        if self.stopped:
+            self.kill()
+        if host_monitor is not None:
+            host_monitor.track(process.pid)
+        readers = asyncio.gather(self._pump(process.stdout, self.on_stdout),
+                                 self._pump(process.stderr, self.on_stderr))
+
+        watcher = ProjectWatcher(self.project_dir) if self.early_stop_grace > 0 else None
+        try:
+            while process.returncode is None:
+                wake_at = min(self.next_deadline(), time.time() + WATCH_INTERVAL)
+                if readers.done():
+                    await self._wait_exit(wake_at - time.time())
                 else:
-                    project_status[name]["status"] = "Done"
-                    project_status[name]["step"] = "Task Completed Successfully"
-                    project_status[name]["progress"] = 100
-                    mark_project_done(project_dir)
-                    log("Task completed successfully.", project=name)
-                    break # Success
-                    
-                update_ui_cb()
-                break # If not retrying, break loop
-                    
-            except subprocess.TimeoutExpired:
-                process.kill()
-                log(f"Subprocess timed out.", level="ERROR", project=name)
-                project_status[name]["status"] = "Timed Out"
-                update_ui_cb()
+                    await asyncio.wait([readers], timeout=max(0, wake_at - time.time()))
+                if process.returncode is not None:
+                    break
+                now = time.time()
+                reason = self.check_deadlines(now)
+                if reason:
+                    self.kill()
+                    self.timed_out = True
+                    self.stop_reason = reason
+                    for name in self.members or [self.name]:
+                        mark_timed_out(name, reason, self.update_ui_cb)
+                    break
+                if watcher is not None and self.output_stable(watcher, now):
+                    # Ask politely; the cleanup below escalates to SIGKILL
+                    self.kill(signal.SIGTERM)
+                    self.completed_early = True
+                    self.stop_reason = f"Output verified and unchanged for {self.early_stop_grace}s"
+                    log(f"Stopping agent early: {self.stop_reason}.", project=self.name)
+                    break
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+        # Small grace period for final cleanup
+        if not await self._wait_exit(10):
+            self.kill()
+            await self._wait_exit(10)
+        self.returncode = process.returncode
+        # Nothing the agent started may outlive it, or hold its pipes open
+        kill_process_group(process.pid)
+        if self.sandbox is not None:
+            self.sandbox.close()
+        _, pending = await asyncio.wait([readers], timeout=10)
+        for task in pending:
+            task.cancel()
+        if host_monitor is not None:
+            host_monitor.untrack(process.pid)
+        self.max_idle = max(self.max_idle, time.time() - self.last_output)
+
+        handle_stderr(self.name, "".join(self.stderr_lines), self.stderr_rate_limited, self.error_lines)
+        return self
+
+class AgentIOLoop:
+    """Background event loop that runs AgentAttempts for the threaded supervisor,
+    so no worker thread ever blocks on a pipe."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="agent-io", daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+def get_io_loop():
+    global io_loop
+    with init_lock:
+        if io_loop is None:
+            io_loop = AgentIOLoop()
+    return io_loop
+
+def mark_done(name, project_dir, step, message):
+    project_status[name]["status"] = "Done"
+    project_status[name]["step"] = step
+    project_status[name]["progress"] = 100
+    mark_project_done(project_dir, step)
+    log(message, project=name)
+
+def mark_failed(name, returncode):
+    project_status[name]["status"] = "Failed"
+    project_status[name]["step"] = f"Exit Code: {returncode}"
+
+def resolve_attempt(name, project_dir, timed_out, is_rate_limited, returncode, completed_early=False, looped=False):
+    """Decide the outcome of a finished attempt.
+
+    Returns "done", "looped", "timed_out", "failed" or "rate_limited". Only the
+    last one is retryable; the caller decides whether retries are left.
+    """
+    if completed_early:
+        # The watcher already verified the output before stopping the agent
+        mark_done(name, project_dir, "Task Completed (Stopped early: output verified)", "Task completed (stopped early after verification).")
+        return "done"
+
+    if looped:
+        if verify_integrity(project_dir):
+            mark_done(name, project_dir, "Task Completed (Detected after Loop)", "Task completed (detected after stopping a loop).")
+            return "done"
+        log("Agent stopped in an output loop.", level="ERROR", project=name)
+        project_status[name]["status"] = "Failed"
+        project_status[name]["step"] = "Stopped: output loop"
+        return "looped"
+
+    if timed_out:
+        # Even on timeout, check if it's actually done
+        if verify_integrity(project_dir):
+            mark_done(name, project_dir, "Task Completed (Detected after Timeout)", "Task completed (detected after timeout).")
+            return "done"
+        return "timed_out"
+
+    if is_rate_limited or returncode != 0:
+        # Check if it's actually done despite the error/rate limit
+        if verify_integrity(project_dir):
+            mark_done(name, project_dir, "Task Completed (Detected after Error)", "Task completed (detected after error).")
+            return "done"
+
+        error_type = "RateLimit" if is_rate_limited else "FatalError"
+        log(f"Agent failed. Type: {error_type}, Code: {returncode}", level="ERROR", project=name)
+
+        if is_rate_limited:
+            concurrency.on_rate_limit() # Reduce concurrency on rate limit
+            if rate_bucket is not None:
+                # Pause launches in every controller sharing the quota
+                rate_bucket.penalize(shared_backoff)
+            return "rate_limited"
+
+        mark_failed(name, returncode)
+        return "failed"
+
+    mark_done(name, project_dir, "Task Completed Successfully", "Task completed successfully.")
+    return "done"
+
+def schedule_retry(name, retries, update_ui_cb):
+    """Record a rate-limit retry and return how long to wait before it."""
+    wait_time = min(MAX_BACKOFF, (2 ** retries) + random.random() * 5)
+    log(f"Retrying in {wait_time:.2f}s...", project=name)
+    project_status[name]["status"] = "Retrying"
+    project_status[name]["step"] = f"Rate limited. Waiting {wait_time:.2f}s"
+    update_ui_cb()
+    return wait_time
+
+class Job:
+    """A project waiting for an agent slot."""
+    _counter = itertools.count()
+
+    def __init__(self, project, project_dir, command, max_retries=MAX_RETRIES):
+        self.project = project
+        self.name = project["name"]
+        self.project_dir = project_dir
+        self.command = command
+        self.max_retries = max_retries
+        self.retries = 0
+        self.not_before = 0
+        self.attempt_id = None
+        self.cache_key = None
+        self.rank = (0, 0)
+        self.timeout = None  # None: the global EXECUTION_TIMEOUT / IDLE_TIMEOUT
+        self.idle_timeout = None
+        self.batchable = False  # May share an agent with other small projects
+        self.seq = next(self._counter)
+
+class Scheduler(Waitable):
+    """Queue of jobs that are ready to run or backing off.
+
+    Ready jobs are served by rank (see `job_rank`), ties in submission order. A job that hit a rate limit is
+    parked with a not-before time and holds no slot meanwhile, so any ready job
+    can use the slot it released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._ready = []  # heap of (rank, seq, job)
+        self._delayed = []  # heap of (not_before, seq, job)
+        self._blocked = {}  # name -> [job, unfinished dependencies]
+        self._dependents = {}  # name -> jobs waiting for it
+        self._outstanding = 0
+
+    def _enqueue_locked(self, job):
+        if job.not_before > time.time():
+            heapq.heappush(self._delayed, (job.not_before, job.seq, job))
+        else:
+            heapq.heappush(self._ready, (job.rank, job.seq, job))
+
+    def submit(self, job, not_before=0, waiting_on=()):
+        """Queue a job. With `waiting_on`, it stays blocked until every named job finished successfully."""
+        with self._cond:
+            self._outstanding += 1
+            job.not_before = not_before
+            if waiting_on:
+                self._blocked[job.name] = [job, len(waiting_on)]
+                for dep in waiting_on:
+                    self._dependents.setdefault(dep, []).append(job)
+            else:
+                self._enqueue_locked(job)
+            self._notify_locked()
+
+    def requeue(self, job, delay):
+        with self._cond:
+            job.not_before = time.time() + delay
+            heapq.heappush(self._delayed, (job.not_before, job.seq, job))
+            self._notify_locked()
+
+    def finish(self, job, succeeded=True):
+        """Retire a job and settle its dependents.
+
+        Returns (released, skipped): jobs whose last dependency just succeeded,
+        and (job, upstream) pairs dropped because a dependency failed, with the
+        failure cascading to their own dependents.
+        """
+        released, skipped = [], []
+        with self._cond:
+            self._outstanding -= 1
+            settle = [(job, succeeded)]
+            while settle:
+                upstream, ok = settle.pop()
+                for dependent in self._dependents.pop(upstream.name, []):
+                    entry = self._blocked.get(dependent.name)
+                    if entry is None:
+                        continue
+                    if ok:
+                        entry[1] -= 1
+                        if entry[1] > 0:
+                            continue
+                        del self._blocked[dependent.name]
+                        self._enqueue_locked(dependent)
+                        released.append(dependent)
+                    else:
+                        del self._blocked[dependent.name]
+                        self._outstanding -= 1
+                        skipped.append((dependent, upstream.name))
+                        settle.append((dependent, False))
+            self._notify_locked()
+        return released, skipped
+
+    def take(self, match, limit):
+        """Remove and return up to `limit` ready jobs for which `match` holds, best ranked first."""
+        with self._cond:
+            self._poll_locked(take=False)
+            picked = [entry for entry in sorted(self._ready) if match(entry[2])][:limit]
+            if picked:
+                chosen = {entry[1] for entry in picked}
+                self._ready = [entry for entry in self._ready if entry[1] not in chosen]
+                heapq.heapify(self._ready)
+            return [entry[2] for entry in picked]
+
+    def has_ready(self):
+        """True if some job could start right now."""
+        with self._cond:
+            return bool(self._ready) or bool(self._delayed and self._delayed[0][0] <= time.time())
+
+    def _poll_locked(self, take=True):
+        """Return a ready job, or None and how long to wait (None: until notified).
+        With take=False the job stays at the head of the queue."""
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            heapq.heappush(self._ready, (job.rank, job.seq, job))
+        if self._ready:
+            return (heapq.heappop(self._ready) if take else self._ready[0])[2], None
+        if self._outstanding == 0:
+            return None, None
+        return None, (self._delayed[0][0] - now if self._delayed else None)
+
+    def get(self, take=True):
+        """Block until a job is ready; None means nothing is left to run."""
+        with self._cond:
+            while True:
+                job, wait = self._poll_locked(take)
+                if job is not None or self._outstanding == 0:
+                    return job
+                self._cond.wait(timeout=wait)
+
+    async def get_async(self, take=True):
+        while True:
+            with self._cond:
+                job, wait = self._poll_locked(take)
+                if job is not None or self._outstanding == 0:
+                    return job
+                fut = self._add_async_waiter_locked()
+            await self._wait_async(fut, wait)
+
+def estimate_costs(names, stats):
+    """Expected seconds until each project succeeds, from its attempt history.
+
+    The typical attempt duration is divided by a smoothed success rate, so a
+    project that often fails counts as longer. Projects without history get
+    the median of the others, or half the timeout when nothing is known.
+    """
+    costs = {}
+    for name in names:
+        row = stats.get(name)
+        duration = row and (row["success_duration"] or row["mean_duration"])
+        if duration:
+            costs[name] = duration * (row["attempts"] + 2) / ((row["successes"] or 0) + 1)
+    default = percentile(sorted(costs.values()), 50) or EXECUTION_TIMEOUT / 2
+    return {name: costs.get(name, default) for name in names}
+
+def job_rank(project, cost, policy=None, downstream=0):
+    """Sort key of a job in the ready queue: higher `priority` first, then the
+    longest chain of dependents waiting on it (the critical path), then the policy."""
+    policy = policy or SCHEDULING_POLICY
+    priority = -project.get("priority", 0)
+    if policy == "sjf":
+        return (priority, -downstream, cost)
+    if policy == "ljf":
+        # Longest first keeps a long task from starting last and stretching the makespan
+        return (priority, -downstream, -cost)
+    return (priority, -downstream, 0)
+
+def skip_project(name, upstream, update_ui_cb):
+    """Give up on a project because one of its dependencies did not succeed."""
+    log(f"Skipped: dependency '{upstream}' did not finish successfully.", level="WARNING", project=name)
+    project_status[name] = {"status": "Skipped", "step": f"Upstream failed: {upstream}", "progress": 0}
+    get_state_store().set_status(name, "Skipped", step=project_status[name]["step"])
+    journal("finished", project=name, status="Skipped")
+    update_ui_cb()
+
+def build_scheduler(projects, update_ui_cb, resume_state=None):
+    """Queue every unfinished project. When resuming, restore retry counts and
+    backoff deadlines and leave projects the journal saw finish untouched.
+    Projects with unfinished dependencies wait blocked in the scheduler."""
+    scheduler = Scheduler()
+    order, dependents = topological_order(projects)
+    has_edges = any(dependents.values())
+    wants_stats = SCHEDULING_POLICY != "fifo" or has_edges or BATCH_SIZE > 1
+    stats = get_state_store().attempt_stats() if wants_stats else {}
+    costs = estimate_costs([p["name"] for p in projects], stats)
+    downstream = downstream_costs(order, dependents, costs)
+    timeouts = None
+    if ADAPTIVE_TIMEOUTS:
+        timeouts = TimeoutPolicy(get_state_store().attempt_history(), projects, EXECUTION_TIMEOUT, IDLE_TIMEOUT,
+                                 max_timeout=max(ADAPTIVE_MAX_TIMEOUT, EXECUTION_TIMEOUT))
+    if stats:
+        known = sum(1 for p in projects if p["name"] in stats)
+        log(f"Scheduling by {SCHEDULING_POLICY}: history for {known} of {len(projects)} projects.")
+
+    jobs = {}
+    for project in projects:
+        name = project["name"]
+        if resume_state and name in resume_state["finished"]:
+            status = resume_state["finished"][name]
+            project_status[name] = {"status": status, "step": f"Finished in run {resume_state['run_id']}",
+                                    "progress": 100 if status == "Done" else 0}
+            update_ui_cb()
+            continue
+        project_dir = prepare_project(project, update_ui_cb)
+        if project_dir is None:
+            continue
+        job = Job(project, project_dir, build_command(project, project_dir))
+        job.rank = job_rank(project, costs[name], downstream=downstream[name])
+        if BATCH_SIZE > 1:
+            job.batchable = batchable(project, not existing_project_files(project_dir), bool(dependents[name]),
+                                      costs[name] if name in stats else None, BATCH_MAX_COST)
+        if timeouts is not None:
+            job.timeout, job.idle_timeout, why = timeouts.budgets(name)
+            log(f"Budget: {why}", project=name)
+        if result_cache is not None and not existing_project_files(project_dir) and not dependencies(project):
+            # Only a fresh prompt is a pure function of the task and instructions;
+            # a dependent's result also depends on its upstream output
+            job.cache_key = cache_key(project["task"], SYSTEM_GUIDELINES, get_subagent_instructions())
+        if resume_state:
+            job.retries = resume_state["retries"].get(name, 0)
+            job.not_before = resume_state["not_before"].get(name, 0)
+            if name in resume_state["interrupted"]:
+                log(f"Attempt interrupted by controller crash; rerunning without spending a retry.", project=name)
+        jobs[name] = job
+
+    # Submit in dependency order, so a project that can never run is known
+    # to be skipped before its own dependents are looked at
+    by_name = {p["name"]: p for p in projects}
+    for name in order:
+        job = jobs.get(name)
+        if job is None:
+            continue
+        deps = dependencies(by_name[name])
+        failed = [d for d in deps if d not in jobs and project_status[d]["status"] != "Done"]
+        if failed:
+            del jobs[name]
+            skip_project(name, failed[0], update_ui_cb)
+            continue
+        waiting_on = [d for d in deps if d in jobs]
+        if waiting_on:
+            project_status[name].update(status="Blocked", step=f"Waiting for {', '.join(waiting_on)}")
+            update_ui_cb()
+        scheduler.submit(job, not_before=job.not_before, waiting_on=waiting_on)
+    return scheduler
+
+def record_attempt(job, returncode, outcome, max_idle=None):
+    """Persist the attempt result and the project's resulting status."""
+    store = get_state_store()
+    if job.attempt_id is not None:
+        store.finish_attempt(job.attempt_id, returncode, outcome, max_idle)
+        job.attempt_id = None
+    info = project_status[job.name]
+    store.set_status(job.name, info["status"], step=info["step"], exit_code=returncode)
+    journal("attempt_end", project=job.name, outcome=outcome, exit_code=returncode)
+
+def finish_job(scheduler, job, update_ui_cb):
+    status = project_status[job.name]["status"]
+    journal("finished", project=job.name, status=status)
+    released, skipped = scheduler.finish(job, succeeded=status == "Done")
+    for dependent in released:
+        project_status[dependent.name].update(status="Pending", step="Dependencies done. Waiting in queue...")
+    for dependent, upstream in skipped:
+        skip_project(dependent.name, upstream, update_ui_cb)
+    if released:
+        update_ui_cb()
+
+def restore_from_cache(scheduler, job, update_ui_cb):
+    """Finish the job from a cached result without launching an agent. Returns True on a hit."""
+    if result_cache is None or job.cache_key is None:
+        return False
+    if not result_cache.materialize(job.cache_key, job.project_dir):
+        return False
+    if not verify_integrity(job.project_dir):
+        log("Cached result failed the integrity check; running the agent.", level="WARNING", project=job.name)
+        return False
+    mark_done(job.name, job.project_dir, "Restored from cache", f"Restored result from cache ({job.cache_key[:12]}).")
+    update_ui_cb()
+    finish_job(scheduler, job, update_ui_cb)
+    return True
+
+def complete_attempt(scheduler, job, attempt, update_ui_cb):
+    """Resolve a finished attempt and either finish the job or requeue it with a delay."""
+    outcome = resolve_attempt(job.name, job.project_dir, attempt.timed_out, attempt.is_rate_limited,
+                              attempt.returncode, completed_early=attempt.completed_early, looped=attempt.looped)
+    if outcome == "done" and result_cache is not None and job.cache_key is not None:
+        result_cache.store(job.cache_key, job.project_dir, project=job.name)
+    if outcome == "rate_limited":
+        job.retries += 1
+        if job.retries <= job.max_retries:
+            wait_time = schedule_retry(job.name, job.retries, update_ui_cb)
+            record_attempt(job, attempt.returncode, outcome, attempt.max_idle)
+            journal("requeue", project=job.name, retries=job.retries, not_before=time.time() + wait_time)
+            scheduler.requeue(job, wait_time)
+            return
+        mark_failed(job.name, attempt.returncode)
+
+    record_attempt(job, attempt.returncode, outcome, attempt.max_idle)
+    update_ui_cb()
+    finish_job(scheduler, job, update_ui_cb)
+
+def fail_job(scheduler, job, error, update_ui_cb):
+    log(f"Exception: {str(error)}", level="CRITICAL", project=job.name)
+    project_status[job.name]["status"] = "Error"
+    project_status[job.name]["step"] = str(error)[:50]
+    record_attempt(job, None, "error")
+    update_ui_cb()
+    finish_job(scheduler, job, update_ui_cb)
+
+def note_shared_rate_limits(events):
+    """Shrink concurrency when another process reported a rate limit through the shared bucket."""
+    global shared_rate_events
+    if shared_rate_events is not None and events > shared_rate_events:
+        concurrency.on_rate_limit()
+    shared_rate_events = events
+
+def batch_dir():
+    # Beside projects/, like the hedge copies, so collecting a result is a rename
+    return os.path.join(os.path.dirname(PROJECTS_DIR), ".batches")
+
+def hedge_dir():
+    # Beside projects/ so promotion is a rename, but outside it so the critic
+    # and the manifest never list a scratch copy
+    return os.path.join(os.path.dirname(PROJECTS_DIR), ".hedges")
+
+def launch_hedge(scheduler, job, elapsed, update_ui_cb):
+    """Start a twin of a straggling attempt in a scratch copy of its project.
+
+    Returns (attempt, task, scratch, attempt_id), or None when the attempt is
+    not a straggler, a job is waiting for a slot, no slot or launch token is
+    free, or the hedge budget is spent. Runs on the event loop thread.
+    """
+    if not hedger.should_hedge(elapsed) or scheduler.has_ready():
+        return None
+    if not concurrency.try_acquire():
+        return None
+    if (rate_bucket is not None and rate_bucket.try_acquire()[0] > 0) or not hedger.claim():
+        concurrency.release()
+        return None
+    try:
+        scratch = scratch_copy(job.project_dir, hedge_dir(), job.name)
+    except (OSError, shutil.Error) as e:
+        log(f"Could not copy the project for a hedge attempt: {e}", level="WARNING", project=job.name)
+        concurrency.release()
+        return None
+    log(f"Running for {elapsed:.0f}s, past the p{hedger.pct} of finished peers ({hedger.threshold():.0f}s). "
+        f"Launching a hedge attempt ({hedger.launched}/{hedger.budget}).", project=job.name)
+    attempt_id = get_state_store().start_attempt(job.name, job.retries + 1)
+    journal("hedge_start", project=job.name, elapsed=elapsed)
+    attempt = AgentAttempt(job.name, scratch, build_command(job.project, scratch), update_ui_cb,
+                           timeout=job.timeout, idle_timeout=job.idle_timeout)
+    return attempt, asyncio.ensure_future(attempt.run()), scratch, attempt_id
+
+async def race_hedge(job, attempt, primary, hedge):
+    """Wait for the first of two twin attempts to produce a verified result.
+
+    The winner's attempt is returned. A winning hedge's scratch copy is swapped
+    into the project directory; the loser is killed and its files discarded.
+    """
+    twin, secondary, scratch, twin_id = hedge
+    pending = {primary, secondary}
+    winner = None
+    while pending and winner is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        # On a tie the primary wins, which needs no promotion
+        if primary in done and primary.exception() is None and verify_integrity(job.project_dir):
+            winner = primary
+        elif secondary in done and secondary.exception() is None and verify_integrity(scratch):
+            winner = secondary
+    for task, loser in ((primary, attempt), (secondary, twin)):
+        if task is not winner and not task.done():
+            loser.stop("Lost the hedge race")
+    await asyncio.gather(primary, secondary, return_exceptions=True)
+    concurrency.release()
+
+    if winner is secondary:
+        exchange_dirs(job.project_dir, scratch)
+        log("Hedge attempt finished first; promoted its result.", project=job.name)
+    shutil.rmtree(scratch, ignore_errors=True)
+    outcome = "hedge_won" if winner is secondary else "hedge_lost"
+    get_state_store().finish_attempt(twin_id, twin.returncode, outcome, twin.max_idle)
+    journal("hedge_end", project=job.name, outcome=outcome)
+    return twin if winner is secondary else primary.result()
+
+async def run_attempt(scheduler, job, update_ui_cb):
+    """Run the job's agent and return its AgentAttempt. With hedging on, a
+    straggling attempt may be raced against a twin."""
+    attempt = AgentAttempt(job.name, job.project_dir, job.command, update_ui_cb,
+                           timeout=job.timeout, idle_timeout=job.idle_timeout)
+    if hedger is None:
+        return await attempt.run()
+
+    started = time.time()
+    primary = asyncio.ensure_future(attempt.run())
+    hedge = None
+    while hedge is None:
+        await asyncio.wait([primary], timeout=hedger.interval)
+        if primary.done():
+            break
+        hedge = launch_hedge(scheduler, job, time.time() - started, update_ui_cb)
+    result = await race_hedge(job, attempt, primary, hedge) if hedge else primary.result()
+    if verify_integrity(job.project_dir):
+        hedger.record(time.time() - started)
+    return result
+
+def run_job(scheduler, job, update_ui_cb, release=True):
+    """Run one attempt of a job in the slot acquired by the dispatcher (released
+    afterwards unless the caller keeps it)."""
+    try:
+        if restore_from_cache(scheduler, job, update_ui_cb):
+            return
+        if rate_bucket is not None:
+            note_shared_rate_limits(rate_bucket.acquire())
+        start_attempt(job, update_ui_cb)
+        attempt = get_io_loop().run(run_attempt(scheduler, job, update_ui_cb))
+        complete_attempt(scheduler, job, attempt, update_ui_cb)
+    except Exception as e:
+        fail_job(scheduler, job, e, update_ui_cb)
+    finally:
+        if release:
+            concurrency.release()
+
+async def run_job_async(scheduler, job, update_ui_cb, release=True):
+    """Asyncio counterpart of run_job."""
+    try:
+        if restore_from_cache(scheduler, job, update_ui_cb):
+            return
+        if rate_bucket is not None:
+            note_shared_rate_limits(await rate_bucket.acquire_async())
+        start_attempt(job, update_ui_cb)
+        attempt = await run_attempt(scheduler, job, update_ui_cb)
+        complete_attempt(scheduler, job, attempt, update_ui_cb)
+    except Exception as e:
+        fail_job(scheduler, job, e, update_ui_cb)
+    finally:
+        if release:
+            concurrency.release()
+
+def restore_batch_from_cache(scheduler, jobs, update_ui_cb):
+    """Finish the members with a cached result and return the others."""
+    remaining = []
+    for job in jobs:
+        try:
+            if not restore_from_cache(scheduler, job, update_ui_cb):
+                remaining.append(job)
+        except Exception as e:
+            fail_job(scheduler, job, e, update_ui_cb)
+    return remaining
+
+def start_batch(remaining, update_ui_cb):
+    """Start one attempt over several jobs, in a workspace with a sub-directory per project."""
+    names = [job.name for job in remaining]
+    label = f"batch-{remaining[0].seq}"
+    log(f"Running {len(names)} projects in one agent: {', '.join(names)}", project=label)
+    workspace = batch_workspace(batch_dir(), names)
+    for job in remaining:
+        start_attempt(job, update_ui_cb)
+        project_status[job.name]["step"] = f"In {label} of {len(names)}..."
+    # The agent works through the projects one after another
+    timeout = sum(EXECUTION_TIMEOUT if job.timeout is None else job.timeout for job in remaining)
+    idle = max(IDLE_TIMEOUT if job.idle_timeout is None else job.idle_timeout for job in remaining)
+    attempt = AgentAttempt(label, workspace, build_batch_command(remaining), update_ui_cb,
+                           timeout=timeout, idle_timeout=idle, early_stop_grace=0, members=names)
+    return attempt
+
+def complete_batch(scheduler, jobs, attempt, update_ui_cb):
+    """Split a finished batch: move every verified sub-directory into its project
+    and requeue the other members, which then run alone."""
+    retry = []
+    for job in jobs:
+        try:
+            subdir = os.path.join(attempt.project_dir, job.name)
+            if not verify_integrity(subdir):
+                retry.append(job)
+                continue
+            collect(subdir, job.project_dir)
+            mark_done(job.name, job.project_dir, f"Task Completed (Batch of {len(jobs)})", f"Task completed in {attempt.name}.")
+            if result_cache is not None and job.cache_key is not None:
+                result_cache.store(job.cache_key, job.project_dir, project=job.name)
+            record_attempt(job, attempt.returncode, "batched")
+            update_ui_cb()
+            finish_job(scheduler, job, update_ui_cb)
+        except Exception as e:
+            fail_job(scheduler, job, e, update_ui_cb)
+    shutil.rmtree(attempt.project_dir, ignore_errors=True)
+    if retry and attempt.is_rate_limited:
+        concurrency.on_rate_limit()
+        if rate_bucket is not None:
+            rate_bucket.penalize(shared_backoff)
+
+    for job in retry:
+        if attempt.is_rate_limited:
+            job.retries += 1
+            if job.retries > job.max_retries:
+                mark_failed(job.name, attempt.returncode)
+                record_attempt(job, attempt.returncode, "rate_limited")
+                finish_job(scheduler, job, update_ui_cb)
+                continue
+            wait_time = schedule_retry(job.name, job.retries, update_ui_cb)
+            outcome = "rate_limited"
+        else:
+            # Not a quota problem, so it costs no retry; alone, the agent gets the whole budget for it
+            job.batchable = False
+            wait_time = 0
+            outcome = "batch_failed"
+            log(f"Not completed in {attempt.name}; requeued to run alone.", level="WARNING", project=job.name)
+            project_status[job.name].update(status="Pending", step="Requeued to run alone")
+        record_attempt(job, attempt.returncode, outcome)
+        journal("requeue", project=job.name, retries=job.retries, not_before=time.time() + wait_time)
+        scheduler.requeue(job, wait_time)
+    update_ui_cb()
+
+def run_batch(scheduler, jobs, update_ui_cb):
+    """Run several small jobs in one agent, in the single slot acquired by the dispatcher."""
+    try:
+        jobs = restore_batch_from_cache(scheduler, jobs, update_ui_cb)
+        if len(jobs) < 2:
+            for job in jobs:
+                run_job(scheduler, job, update_ui_cb, release=False)
+            return
+        if rate_bucket is not None:
+            note_shared_rate_limits(rate_bucket.acquire())
+        try:
+            attempt = start_batch(jobs, update_ui_cb)
+            get_io_loop().run(attempt.run())
+        except Exception as e:
+            for job in jobs:
+                fail_job(scheduler, job, e, update_ui_cb)
+            return
+        complete_batch(scheduler, jobs, attempt, update_ui_cb)
+    finally:
+        concurrency.release()
+
+async def run_batch_async(scheduler, jobs, update_ui_cb):
+    """Asyncio counterpart of run_batch."""
+    try:
+        jobs = restore_batch_from_cache(scheduler, jobs, update_ui_cb)
+        if len(jobs) < 2:
+            for job in jobs:
+                await run_job_async(scheduler, job, update_ui_cb, release=False)
+            return
+        if rate_bucket is not None:
+            note_shared_rate_limits(await rate_bucket.acquire_async())
+        try:
+            attempt = start_batch(jobs, update_ui_cb)
+            await attempt.run()
+        except Exception as e:
+            for job in jobs:
+                fail_job(scheduler, job, e, update_ui_cb)
+            return
+        complete_batch(scheduler, jobs, attempt, update_ui_cb)
+    finally:
+        concurrency.release()
+
+def take_batch(scheduler, job):
+    """The job plus as many other ready batchable jobs as fit in one invocation."""
+    if BATCH_SIZE < 2 or not job.batchable:
+        return [job]
+    return [job] + scheduler.take(lambda other: other.batchable, BATCH_SIZE - 1)
+
+def run_all_threaded(projects, update_ui_cb, resume_state=None):
+    """Dispatch ready jobs to a thread pool sized to the concurrency ceiling."""
+    scheduler = build_scheduler(projects, update_ui_cb, resume_state)
+    with ThreadPoolExecutor(max_workers=concurrency.max_limit) as executor:
+        while True:
+            # Wait for work before taking a slot, so an idle dispatcher holds
+            # none, then take the job at the last moment
+            if scheduler.get(take=False) is None:
                 break
-            except Exception as e:
-                log(f"Exception: {str(e)}", level="CRITICAL", project=name)
-                project_status[name]["status"] = "Error"
-                project_status[name]["step"] = str(e)[:50]
-                update_ui_cb()
+            concurrency.acquire()
+            job = scheduler.get()
+            if job is None:
+                concurrency.release()
                 break
+            batch = take_batch(scheduler, job)
+            if len(batch) > 1:
+                executor.submit(run_batch, scheduler, batch, update_ui_cb)
+            else:
+                executor.submit(run_job, scheduler, job, update_ui_cb)
+
+async def run_all_async(projects, update_ui_cb, resume_state=None):
+    """Supervise every project on a single event loop."""
+    scheduler = build_scheduler(projects, update_ui_cb, resume_state)
+    tasks = set()
+    while True:
+        if await scheduler.get_async(take=False) is None:
+            break
+        await concurrency.acquire_async()
+        job = await scheduler.get_async()
+        if job is None:
+            concurrency.release()
+            break
+        batch = take_batch(scheduler, job)
+        if len(batch) > 1:
+            task = asyncio.ensure_future(run_batch_async(scheduler, batch, update_ui_cb))
+        else:
+            task = asyncio.ensure_future(run_job_async(scheduler, job, update_ui_cb))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+# Rows worth seeing first when the table is windowed
+STATUS_ORDER = {"Running": 0, "Retrying": 1, "Error": 2, "Failed": 3, "Timed Out": 4, "Skipped": 5,
+                "Pending": 6, "Blocked": 7, "Done": 8}
+
+def status_counts():
+    counts = {}
+    for info in list(project_status.values()):
+        counts[info["status"]] = counts.get(info["status"], 0) + 1
+    return counts
+
+def visible_projects(max_rows=None):
+    """Rows for the table: all of them, or the `max_rows` most interesting ones."""
+    rows = list(project_status.items())
+    if max_rows is None or len(rows) <= max_rows:
+        return rows
+    # Stable sort, so projects keep their queue order within a status
+    rows.sort(key=lambda item: STATUS_ORDER.get(item[1]["status"], len(STATUS_ORDER)))
+    return rows[:max_rows]
+
+def generate_table(max_rows=None):
+    # Rich is only needed for the TUI; --headless runs never import it
+    from rich.table import Table
 
-def generate_table():
     table = Table(title="[bold blue]Gemini CLI Sub-Agent Dashboard[/bold blue]", expand=True)
     table.add_column("Project", style="cyan", width=20, no_wrap=True, overflow="ellipsis")
     table.add_column("Status", style="magenta", width=12, no_wrap=True, overflow="ellipsis")
     table.add_column("Current Step", style="green", width=50, no_wrap=True, overflow="ellipsis")
     table.add_column("Progress", style="yellow", width=20, no_wrap=True)
-    table.add_column("Limit", style="red", width=6, no_wrap=True)
+    table.add_column("Limit", style="red", width=8, no_wrap=True)
 
-    for name, info in project_status.items():
+    state = concurrency.snapshot()
+    host = f", host saturated: {state['host_blocked']}" if state["host_blocked"] else ""
+    rows = visible_projects(max_rows)
+    totals = ", ".join(f"{status} {count}" for status, count in sorted(status_counts().items(),
+                       key=lambda item: STATUS_ORDER.get(item[0], len(STATUS_ORDER))))
+    table.caption = (f"Concurrency limit {state['limit']}/{state['max_limit']}, in flight {state['in_flight']} "
+                     f"(last change: {state['last_reason']}){host}\n"
+                     f"Showing {len(rows)} of {len(project_status)}: {totals}")
+    for name, info in rows:
         prog = info["progress"]
         table.add_row(
             name, 
             info["status"], 
             info["step"], 
             f"[{'#' * (prog // 10)}{'.' * (10 - prog // 10)}] {prog}%",
-            str(current_max_workers)
+            f"{state['in_flight']}/{state['limit']}"
         )
     return table
 
+class Dashboard:
+    """Redraws the live table from its own thread at a fixed frame rate.
+
+    Workers only call `mark_dirty()`, which sets a flag. The render thread
+    rebuilds the table at most `fps` times a second and only when something
+    changed, so UI cost no longer grows with the number of status events.
+    """
+
+    def __init__(self, live, fps=DASHBOARD_FPS, max_rows=DASHBOARD_ROWS):
+        self.live = live
+        self.interval = 1.0 / fps
+        self.max_rows = max_rows
+        self.dirty = True
+        self.frames = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+        return self
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def render(self):
+        self.dirty = False
+        self.live.update(generate_table(self.max_rows), refresh=True)
+        self.frames += 1
+
+    def tick(self):
+        if self.dirty:
+            self.render()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.tick()
+
+    def close(self):
+        """Stop the render thread and draw the final state once."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.render()
+
+class HeadlessReporter(Dashboard):
+    """Dashboard for unattended runs that writes JSON lines to `stream` instead of drawing.
+
+    Each frame emits one `status` event per project whose status or step
+    changed since the previous frame. A `summary` event with per-status
+    totals follows every `summary_interval` seconds and at the end.
+    """
+
+    def __init__(self, stream=None, fps=1, summary_interval=SUMMARY_INTERVAL):
+        super().__init__(None, fps=fps)
+        self.stream = stream or sys.stdout
+        self.summary_interval = summary_interval
+        self.last_summary = time.time()
+        self._seen = {}
+
+    def emit(self, event, **fields):
+        entry = {"ts": round(time.time(), 3), "event": event}
+        entry.update(fields)
+        self.stream.write(json.dumps(entry) + "\n")
+        self.stream.flush()
+
+    def render(self):
+        self.dirty = False
+        for name, info in list(project_status.items()):
+            seen = (info["status"], info["step"])
+            if self._seen.get(name) != seen:
+                self._seen[name] = seen
+                self.emit("status", project=name, status=info["status"], step=info["step"], progress=info["progress"])
+        self.frames += 1
+
+    def summary(self):
+        self.last_summary = time.time()
+        state = concurrency.snapshot()
+        self.emit("summary", counts=status_counts(), total=len(project_status),
+                  limit=state["limit"], in_flight=state["in_flight"], host_blocked=state["host_blocked"])
+
+    def tick(self):
+        super().tick()
+        if time.time() - self.last_summary >= self.summary_interval:
+            self.summary()
+
+    def close(self):
+        if self._thread is None:
+            return
+        super().close()
+        self.summary()
+
 def main():
-    global current_max_workers, concurrency_semaphore
+    global concurrency, log_writer, rate_bucket, state_store, run_journal, result_cache, shared_backoff, hedger, host_monitor
+    global agent_limits, BATCH_SIZE, BATCH_MAX_COST, LOOP_KILL_REPEATS
+    global EXECUTION_TIMEOUT, IDLE_TIMEOUT, EARLY_STOP_GRACE, SCHEDULING_POLICY, ADAPTIVE_TIMEOUTS, ADAPTIVE_MAX_TIMEOUT
     parser = argparse.ArgumentParser(description="Parallel Gemini CLI Controller")
     parser.add_argument("--max-workers", type=int, default=2, help="Maximum number of simultaneous agents")
+    parser.add_argument("--max-limit", type=int, default=None,
+                        help="Ceiling the concurrency limit may probe up to (defaults to --max-workers)")
+    parser.add_argument("--probe-interval", type=float, default=PROBE_INTERVAL,
+                        help="Quiet seconds without rate limits before the concurrency limit grows by one")
+    parser.add_argument("--max-load", type=float, default=MAX_LOAD_PER_CPU,
+                        help="1-minute load average per CPU above which no further agent is started")
+    parser.add_argument("--min-free-mb", type=float, default=MIN_FREE_MB,
+                        help="Memory that must stay available after starting another agent")
+    parser.add_argument("--no-host-admission", action="store_true", help="Ignore host load and memory when admitting agents")
+    parser.add_argument("--agent-memory-mb", type=float, default=None, help="Memory cap of each agent's process tree")
+    parser.add_argument("--agent-cpus", type=float, default=None, help="CPUs each agent's process tree may use")
+    parser.add_argument("--agent-pids", type=int, default=None, help="Processes each agent may run at once")
+    parser.add_argument("--cgroup-parent", default=None,
+                        help="cgroup-v2 directory to create per-agent cgroups in (defaults to the controller's own)")
+    parser.add_argument("--no-cgroups", action="store_true", help="Apply the agent limits as rlimits even where cgroups work")
+    parser.add_argument("--state-db", default=STATE_DB, help="SQLite file holding per-project run state")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of the content-addressed result cache")
+    parser.add_argument("--cache-max-mb", type=float, default=CACHE_MAX_MB, help="Size cap of the result cache (LRU eviction)")
+    parser.add_argument("--cache-link", choices=["reflink", "hardlink", "copy"], default="reflink",
+                        help="How cached results are materialized into project directories")
+    parser.add_argument("--no-cache", action="store_true", help="Always launch an agent, even for a cached prompt")
+    parser.add_argument("--rate-bucket", default=BUCKET_FILE,
+                        help="State file of the launch token bucket shared by all controllers on this host")
+    parser.add_argument("--launch-rate", type=float, default=LAUNCH_RATE, help="Shared agent launches per minute")
+    parser.add_argument("--launch-burst", type=int, default=LAUNCH_BURST, help="Shared launch burst size")
+    parser.add_argument("--shared-backoff", type=float, default=SHARED_BACKOFF,
+                        help="Seconds every controller pauses launches after any rate limit")
+    parser.add_argument("--no-shared-rate-limit", action="store_true", help="Do not coordinate launches with other processes")
+    parser.add_argument("--supervisor", choices=["threads", "asyncio"], default="threads",
+                        help="Run agents on a thread pool or on a single asyncio event loop")
+    parser.add_argument("--timeout", type=float, default=EXECUTION_TIMEOUT, help="Wall-clock seconds allowed per attempt")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="Seconds an agent may go without printing anything before it is killed")
+    parser.add_argument("--early-stop-grace", type=float, default=EARLY_STOP_GRACE,
+                        help="Stop an agent once its output has passed the integrity check and stayed unchanged this long (0 disables)")
+    parser.add_argument("--loop-repeats", type=int, default=LOOP_KILL_REPEATS,
+                        help="Stop an agent whose output repeats a cycle of up to 8 near-identical lines this many "
+                             "times in a row (0 disables)")
+    parser.add_argument("--log-flush-interval", type=float, default=LOG_FLUSH_INTERVAL,
+                        help="Seconds between flushes of controller.log")
+    parser.add_argument("--log-fsync", action="store_true", help="fsync controller.log on every flush")
+    parser.add_argument("--adaptive-timeouts", action="store_true",
+                        help="Derive each project's timeout and idle budget from past runtimes; "
+                             "--timeout and --idle-timeout become the fallback")
+    parser.add_argument("--max-timeout", type=float, default=ADAPTIVE_MAX_TIMEOUT,
+                        help="Ceiling of a learned timeout")
+    parser.add_argument("--policy", choices=SCHEDULING_POLICIES, default=SCHEDULING_POLICY,
+                        help="Order of ready projects within a priority class: file order, shortest or longest "
+                             "expected duration first (estimated from past attempts)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Race straggling attempts against a second attempt in a scratch copy")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE,
+                        help="Runtime percentile of finished peers after which an attempt is hedged")
+    parser.add_argument("--hedge-min-peers", type=int, default=HEDGE_MIN_PEERS,
+                        help="Finished peers required before any attempt is hedged")
+    parser.add_argument("--hedge-budget", type=float, default=HEDGE_BUDGET,
+                        help="Most hedges per run, as a fraction of its projects (at least one)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Run up to this many small, fresh, independent projects in one agent invocation, "
+                             "each in its own sub-directory (1 disables batching)")
+    parser.add_argument("--batch-max-cost", type=float, default=BATCH_MAX_COST,
+                        help="Expected seconds (from past attempts) above which a project always runs alone")
+    parser.add_argument("--headless", action="store_true",
+                        help="No TUI: print JSON-lines status events on stdout (Rich is never imported)")
+    parser.add_argument("--summary-interval", type=float, default=SUMMARY_INTERVAL,
+                        help="Seconds between summary events in --headless mode")
+    parser.add_argument("--fps", type=float, default=DASHBOARD_FPS, help="Dashboard redraws per second, at most")
+    parser.add_argument("--max-rows", type=int, default=DASHBOARD_ROWS,
+                        help="Projects listed in the dashboard; larger batches show a window plus totals")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run from its journal in runs/")
     args = parser.parse_args()
 
-    current_max_workers = args.max_workers
-    concurrency_semaphore = threading.Semaphore(current_max_workers)
+    resume_state = None
+    if args.resume:
+        try:
+            resume_state = replay(args.resume)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    else:
+        # A fresh run starts a fresh log; a resumed run keeps appending to it
+        if os.path.exists(LOG_FILE):
+            os.remove(LOG_FILE)
 
-    if not os.path.exists(PROJECTS_FILE):
-        print(f"Error: {PROJECTS_FILE} not found.")
-        sys.exit(1)
-        
-    with open(PROJECTS_FILE, "r") as f:
-        projects = json.load(f)
+    max_limit = args.max_limit or args.max_workers
+    initial_limit = args.max_workers
+    if resume_state and resume_state["limit"]:
+        initial_limit = min(resume_state["limit"], max_limit)
+    if not args.no_host_admission:
+        host_monitor = HostMonitor(args.max_load, args.min_free_mb)
+    concurrency = ConcurrencyController(initial_limit, max_limit=max_limit, probe_interval=args.probe_interval,
+                                        host=host_monitor)
+    agent_limits = AgentLimits(args.agent_memory_mb, args.agent_cpus, args.agent_pids,
+                               parent=args.cgroup_parent, use_cgroups=not args.no_cgroups)
+    if agent_limits.enabled():
+        log(f"Agent limits: memory {args.agent_memory_mb} MB, {args.agent_cpus} CPUs, "
+            f"{args.agent_pids} processes, enforced by {agent_limits.mode}.")
+    state_store = StateStore(args.state_db)
+    if not args.no_cache:
+        result_cache = ResultCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024), link_mode=args.cache_link)
+    if not args.no_shared_rate_limit:
+        rate_bucket = SharedTokenBucket(args.rate_bucket, rate=args.launch_rate / 60.0, capacity=args.launch_burst)
+    shared_backoff = args.shared_backoff
+    EXECUTION_TIMEOUT = args.timeout
+    IDLE_TIMEOUT = args.idle_timeout
+    EARLY_STOP_GRACE = args.early_stop_grace
+    LOOP_KILL_REPEATS = args.loop_repeats
+    SCHEDULING_POLICY = args.policy
+    ADAPTIVE_TIMEOUTS = args.adaptive_timeouts
+    ADAPTIVE_MAX_TIMEOUT = args.max_timeout
+    BATCH_SIZE, BATCH_MAX_COST = max(1, args.batch_size), args.batch_max_cost
+
+    if resume_state:
+        # The journal holds the exact project list the run started with
+        projects = resume_state["projects"]
+        run_journal = RunJournal(args.resume)
+        run_journal.append("resume", limit=initial_limit)
+    else:
+        if not os.path.exists(PROJECTS_FILE):
+            print(f"Error: {PROJECTS_FILE} not found.")
+            sys.exit(1)
+
+        with open(PROJECTS_FILE, "r") as f:
+            projects = json.load(f)
+        try:
+            topological_order(projects)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+        run_journal = RunJournal(new_run_id())
+        run_journal.append("run_start", projects=projects, limit=initial_limit)
+    if args.headless:
+        reporter = HeadlessReporter(fps=args.fps, summary_interval=args.summary_interval)
+        reporter.emit("run_start", run_id=run_journal.run_id, projects=len(projects), resumed=bool(resume_state))
+    else:
+        print(f"Run ID: {run_journal.run_id} (resume with --resume {run_journal.run_id})")
+    if args.hedge:
+        hedger = Hedger(args.hedge_percentile, args.hedge_min_peers, max(1, int(args.hedge_budget * len(projects))))
         
     os.makedirs(PROJECTS_DIR, exist_ok=True)
     
@@ -341,21 +1694,41 @@ def main():
     for p in projects:
         project_status[p["name"]] = {"status": "Pending", "step": "Waiting in queue...", "progress": 0}
 
-    with Live(generate_table(), refresh_per_second=4) as live:
-        def update_ui():
-            live.update(generate_table())
+    log_writer = LogWriter(LOG_FILE, flush_interval=args.log_flush_interval, fsync=args.log_fsync).start()
+    # Flush buffered telemetry on normal exit, on crash and on SIGTERM
+    atexit.register(log_writer.close)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
 
-        # ThreadPool size doesn't strictly matter as much now because of the semaphore
-        with ThreadPoolExecutor(max_workers=max(10, args.max_workers)) as executor:
-            futures = [executor.submit(run_agent, p, update_ui) for p in projects]
-            for future in futures:
-                future.result()
+    try:
+        def supervise(dashboard):
+            try:
+                if args.supervisor == "asyncio":
+                    asyncio.run(run_all_async(projects, dashboard.mark_dirty, resume_state))
+                else:
+                    run_all_threaded(projects, dashboard.mark_dirty, resume_state)
+            finally:
+                dashboard.close()
+
+        if args.headless:
+            supervise(reporter.start())
+        else:
+            from rich.live import Live
+            with Live(generate_table(args.max_rows), auto_refresh=False) as live:
+                supervise(Dashboard(live, fps=args.fps, max_rows=args.max_rows).start())
+        run_journal.append("run_end")
+    finally:
+        # The critic reads controller.log, so everything must be on disk first
+        log_writer.close()
+        run_journal.close()
 
     # After all projects are done, run the critic agent
-    print("\nExecuting Post-Mortem Analysis...")
-    subprocess.run(["python3", "critic_agent.py"])
+    if args.headless:
+        reporter.emit("run_end", counts=status_counts())
+        # Keep stdout machine-readable; the critic's progress goes to stderr
+        subprocess.run(["python3", "critic_agent.py"], stdout=sys.stderr)
+    else:
+        print("\nExecuting Post-Mortem Analysis...")
+        subprocess.run(["python3", "critic_agent.py"])
 
 if __name__ == "__main__":
-    if os.path.exists(LOG_FILE):
-        os.remove(LOG_FILE)
     main()
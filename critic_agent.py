@@ -3,62 +3,56 @@ import re
 import json
 import subprocess
 from datetime import datetime
+from rate_limiter import SharedTokenBucket, is_rate_limited
+from state_store import StateStore, STATE_DB
+from log_analyzer import LogAnalyzer
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_FILE = os.path.join(BASE_DIR, "controller.log")
 PROJECTS_DIR = os.path.join(BASE_DIR, "projects")
 LESSONS_FILE = os.path.join(BASE_DIR, "LESSONS_LEARNED.md")
 INSTRUCTIONS_FILE = os.path.join(BASE_DIR, "subagent_instructions.txt")
+ANALYSIS_STATE = os.path.join(BASE_DIR, "critic_state.json")  # Log offset and rolling aggregates
 
 def analyze_logs():
+    """Fold the log records written since the last post-mortem into the checkpointed
+    aggregates and report them. Memory stays bounded however long the log grows."""
     if not os.path.exists(LOG_FILE):
         return {"errors": [], "loops": {}}
-    
-    errors = []
-    steps_by_project = {}
+
+    analyzer = LogAnalyzer.load(ANALYSIS_STATE)
     try:
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    proj = entry.get("project")
-                    msg = entry.get("message")
-                    
-                    if entry.get("level") in ["ERROR", "WARNING", "CRITICAL"]:
-                        errors.append(entry)
-                    
-                    if proj and msg:
-                        if proj not in steps_by_project:
-                            steps_by_project[proj] = []
-                        steps_by_project[proj].append(msg)
-                except json.JSONDecodeError:
-                    pass
+        new_records = analyzer.update(LOG_FILE)
     except Exception as e:
         print(f"Error reading logs: {str(e)}")
         return {"errors": [], "loops": {}}
-    
-    # Detect loops (repetitive messages)
-    loops = {}
-    for proj, steps in steps_by_project.items():
-        counts = {}
-        for s in steps:
-            counts[s] = counts.get(s, 0) + 1
-        
-        repeated = {k: v for k, v in counts.items() if v > 5}
-        if repeated:
-            loops[proj] = repeated
-
-    return {"errors": errors, "loops": loops}
+    analyzer.save(ANALYSIS_STATE)
+    print(f"Analyzed {new_records} new log records ({analyzer.records} in total).")
+    return analyzer.report()
 
 def check_project_integrity():
     results = {}
     if not os.path.exists(PROJECTS_DIR):
         return results
+
+    store = StateStore(STATE_DB)
+    states = store.all_projects()
+
+    # Projects the controller recorded as done need no file inspection
+    for project, state in states.items():
+        if state["status"] == "Done":
+            results[project] = {
+                "status": "Done",
+                "is_done": True,
+                "attempts": state["attempts"],
+                "exit_code": state["exit_code"]
+            }
     
     for project in os.listdir(PROJECTS_DIR):
         path = os.path.join(PROJECTS_DIR, project)
-        if os.path.isdir(path):
+        if project not in results and os.path.isdir(path):
             files = os.listdir(path)
+            state = states.get(project, {})
             
             # Basic validity checks
             index_valid = False
@@ -72,6 +66,9 @@ def check_project_integrity():
                     pass
 
             integrity = {
+                "status": state.get("status", "Unknown"),
+                "attempts": state.get("attempts", 0),
+                "exit_code": state.get("exit_code"),
                 "has_readme": "README.md" in files,
                 "has_index": "index.html" in files,
                 "index_valid": index_valid,
@@ -82,12 +79,11 @@ def check_project_integrity():
             
             # PROACTIVE: If it's valid but not marked done, mark it now!
             if index_valid and not integrity["is_done"]:
-                done_file = os.path.join(path, ".done")
-                with open(done_file, "w") as f:
-                    f.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S") + " (Post-Mortem Repair)")
-                print(f"Repaired .done status for {project}")
+                store.set_status(project, "Done", step="Post-Mortem Repair")
+                print(f"Repaired done status for {project}")
                 integrity["is_done"] = True
                 
+    store.close()
     return results
 
 def synthesize_lessons(log_analysis, integrity_results):
@@ -125,6 +121,9 @@ def synthesize_lessons(log_analysis, integrity_results):
     """
     
     try:
+        # Draw from the same launch budget as the controllers on this host
+        bucket = SharedTokenBucket()
+        bucket.acquire()
         process = subprocess.run(
             ["gemini"],
             input=prompt,
@@ -135,6 +134,8 @@ def synthesize_lessons(log_analysis, integrity_results):
         if process.returncode == 0:
             return process.stdout
         else:
+            if is_rate_limited(process.stderr):
+                bucket.penalize()
             return f"Error synthesizing lessons: {process.stderr}"
     except Exception as e:
         return f"Exception during synthesis: {str(e)}"
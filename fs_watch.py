@@ -0,0 +1,84 @@
+import os
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_libc = None
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        _libc.inotify_init1  # Raises AttributeError where inotify does not exist
+    return _libc
+
+class ProjectWatcher:
+    """Reports whether anything in a project directory changed since the last check.
+
+    Uses a non-blocking inotify descriptor where available, so a check is one
+    read() that usually returns EAGAIN. Elsewhere it falls back to comparing
+    an (mtime, size) snapshot of the directory's entries.
+    """
+
+    def __init__(self, path, use_inotify=True):
+        self.path = path
+        self.fd = None
+        self._snapshot = None
+        if use_inotify:
+            try:
+                libc = _load_libc()
+                fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if fd >= 0:
+                    if libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK) >= 0:
+                        self.fd = fd
+                    else:
+                        os.close(fd)
+            except (OSError, AttributeError):
+                self.fd = None
+        self.mode = "inotify" if self.fd is not None else "polling"
+        # Everything counts as new on the first check
+        self._pending = True
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def changed(self):
+        if self.fd is not None:
+            changed = self._pending
+            try:
+                while os.read(self.fd, 64 * 1024):
+                    changed = True
+            except BlockingIOError:
+                pass
+        else:
+            snapshot = self._scan()
+            changed = self._pending or snapshot != self._snapshot
+            self._snapshot = snapshot
+        self._pending = False
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
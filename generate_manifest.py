@@ -1,10 +1,12 @@
 import os
 import json
 import tempfile
+from state_store import STATE_DB as DEFAULT_STATE_DB, load_project_states
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECTS_DIR = os.path.join(BASE_DIR, 'projects')
 MANIFEST_FILE = os.path.join(BASE_DIR, 'projects_manifest.json')
+STATE_DB = DEFAULT_STATE_DB
 
 def atomic_write(file_path, content):
     """Write content to a file atomically using a temporary file."""
@@ -21,6 +23,7 @@ def atomic_write(file_path, content):
 
 def generate_manifest():
     manifest = []
+    states = load_project_states(STATE_DB)
     
     if os.path.exists(PROJECTS_DIR):
         for item in sorted(os.listdir(PROJECTS_DIR)):
@@ -28,9 +31,12 @@ def generate_manifest():
             if os.path.isdir(item_path):
                 # Get sub-items for each project
                 sub_items = sorted(os.listdir(item_path))
+                state = states.get(item, {})
                 manifest.append({
                     "name": item,
-                    "files": sub_items
+                    "files": sub_items,
+                    "status": state.get("status", "Done" if ".done" in sub_items else "Unknown"),
+                    "attempts": state.get("attempts", 0)
                 })
     
     content = json.dumps(manifest, indent=2)
@@ -0,0 +1,93 @@
+import os
+import math
+import shutil
+import ctypes
+import ctypes.util
+import tempfile
+import threading
+
+HEDGE_PERCENTILE = 90  # Runtime percentile of finished peers after which an attempt is hedged
+HEDGE_MIN_PEERS = 3  # Finished peers needed before the percentile means anything
+HEDGE_BUDGET = 0.1  # Hedges allowed per run, as a fraction of its projects
+HEDGE_CHECK_INTERVAL = 5.0  # Seconds between straggler checks of a running attempt
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list, or None when it is empty."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def scratch_copy(project_dir, scratch_root, prefix):
+    """Copy a project into a fresh directory under scratch_root and return its path."""
+    os.makedirs(scratch_root, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix=f"{prefix}-", dir=scratch_root)
+    try:
+        shutil.copytree(project_dir, scratch, symlinks=True, dirs_exist_ok=True)
+    except (OSError, shutil.Error):
+        # The running agent may delete files while they are being copied
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return scratch
+
+def exchange_dirs(a, b):
+    """Swap two directories in one step with renameat2(RENAME_EXCHANGE).
+
+    Where the call or the filesystem does not support it, fall back to three
+    renames, which leave a short window with nothing at `a`.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        if libc.renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+            return
+    except (OSError, AttributeError):
+        pass
+    parked = b + ".swap"
+    os.rename(a, parked)
+    os.rename(b, a)
+    os.rename(parked, b)
+
+class Hedger:
+    """Straggler policy: when an attempt deserves a speculative twin.
+
+    Durations of attempts that produced a verified result are kept sorted.
+    Once there are `min_peers` of them, an attempt running longer than their
+    `pct` percentile is a straggler. `budget` caps the hedges of a whole run,
+    which bounds the extra quota they spend.
+    """
+
+    def __init__(self, pct=HEDGE_PERCENTILE, min_peers=HEDGE_MIN_PEERS, budget=1, interval=HEDGE_CHECK_INTERVAL):
+        self.pct = pct
+        self.min_peers = min_peers
+        self.budget = budget
+        self.interval = interval
+        self.launched = 0
+        self._durations = []
+        self._lock = threading.Lock()
+
+    def record(self, duration):
+        with self._lock:
+            self._durations.append(duration)
+            self._durations.sort()
+
+    def threshold(self):
+        """Runtime after which an attempt is a straggler, or None without enough peers."""
+        with self._lock:
+            if len(self._durations) < self.min_peers:
+                return None
+            return percentile(self._durations, self.pct)
+
+    def should_hedge(self, elapsed):
+        threshold = self.threshold()
+        return threshold is not None and elapsed > threshold and self.launched < self.budget
+
+    def claim(self):
+        """Spend one hedge of the budget. Returns False once it is used up."""
+        with self._lock:
+            if self.launched >= self.budget:
+                return False
+            self.launched += 1
+            return True
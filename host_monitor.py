@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+
+MAX_LOAD_PER_CPU = 1.5  # 1-minute load average per CPU above which no agent is added
+MIN_FREE_MB = 1024  # Memory that must stay available after one more agent starts
+AGENT_RSS_MB = 256  # Assumed footprint of an agent before any has been measured
+SAMPLE_INTERVAL = 2.0  # Seconds a /proc sample is reused
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def read_loadavg():
+    try:
+        with open("/proc/loadavg", "r") as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def read_mem_available():
+    """Bytes of MemAvailable from /proc/meminfo, or None off Linux."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def process_table():
+    """Yield (pid, ppid, pgrp, rss_bytes) for every process, in one pass over /proc."""
+    try:
+        pids = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses; fields resume after the last ')'
+        fields = stat[stat.rfind(")") + 2:].split()
+        try:
+            yield int(pid), int(fields[1]), int(fields[2]), int(fields[21]) * PAGE_SIZE
+        except (ValueError, IndexError):
+            continue
+
+def group_rss(pgids):
+    """Resident bytes of every process in the given process groups."""
+    totals = dict.fromkeys(pgids, 0)
+    if totals:
+        for _, _, pgrp, rss in process_table():
+            if pgrp in totals:
+                totals[pgrp] += rss
+    return totals
+
+def descendants(pid):
+    """Every live process descended from pid, including ones that left its process group."""
+    children = {}
+    for child, parent, _, _ in process_table():
+        children.setdefault(parent, []).append(child)
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+class HostMonitor:
+    """Decides from /proc whether the host has room for one more agent.
+
+    The host is saturated when the 1-minute load average per CPU exceeds
+    `max_load_per_cpu`, or when starting an agent of the average measured
+    size (agents lead their own process groups, so their children count
+    too) would leave less than `min_free_mb` available. Samples are cached
+    for `interval` seconds. Where /proc does not exist, nothing is held back.
+    """
+
+    def __init__(self, max_load_per_cpu=MAX_LOAD_PER_CPU, min_free_mb=MIN_FREE_MB, interval=SAMPLE_INTERVAL):
+        self.max_load_per_cpu = max_load_per_cpu
+        self.min_free = min_free_mb * 1024 * 1024
+        self.interval = interval
+        self.cpus = os.cpu_count() or 1
+        self._agents = set()
+        self._lock = threading.Lock()
+        self._sampled_at = 0
+        self._sample = {}
+
+    def track(self, pgid):
+        with self._lock:
+            self._agents.add(pgid)
+
+    def untrack(self, pgid):
+        with self._lock:
+            self._agents.discard(pgid)
+
+    def sample(self):
+        with self._lock:
+            if time.time() - self._sampled_at < self.interval:
+                return self._sample
+            agents = set(self._agents)
+        rss = group_rss(agents)
+        sample = {
+            "load": read_loadavg(),
+            "available": read_mem_available(),
+            "agents": len(agents),
+            "agent_rss": sum(rss.values()) // len(agents) if agents else None
+        }
+        with self._lock:
+            self._sample, self._sampled_at = sample, time.time()
+        return sample
+
+    def saturated(self):
+        """Why another agent should wait, or None if it fits."""
+        sample = self.sample()
+        load = sample["load"]
+        if load is not None and load / self.cpus > self.max_load_per_cpu:
+            return f"load {load:.1f} on {self.cpus} CPUs"
+        available = sample["available"]
+        if available is not None:
+            need = sample["agent_rss"] or AGENT_RSS_MB * 1024 * 1024
+            if available - need < self.min_free:
+                return f"{available // 2**20} MB available, agents use ~{need // 2**20} MB"
+        return None
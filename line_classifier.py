@@ -0,0 +1,104 @@
+import re
+
+from rate_limiter import RATE_LIMIT_PATTERNS
+
+# (trigger, extract) pairs for the 'current step' shown in the dashboard.
+# Triggers are matched against the lowercased line; the extract pattern then
+# runs case-insensitively where its trigger hit, and group 1 is the step.
+STEP_RULES = [
+    (r"i will\s", r"(I will\s+.*?\.($|\s))"),
+    (r"i'll\s", r"(I'll\s+.*?\.($|\s))"),
+    (r"creating\s", r"(Creating\s+.*)"),
+    (r"reading\s", r"(Reading\s+.*)"),
+    (r"writing\s", r"(Writing\s+.*)"),
+    (r"running\s", r"(Running\s+.*)"),
+    (r"executing\s", r"(Executing\s+.*)"),
+    (r"analyzing\s", r"(Analyzing\s+.*)"),
+    (r"searching\s", r"(Searching\s+.*)")
+]
+# Markers of a failure worth counting even when the agent keeps going.
+# Kept literal: a leading \b or lookaround costs sre its first-character
+# prefilter and makes the combined scan several times slower.
+ERROR_PATTERNS = [
+    r"traceback \(most recent call last\)",
+    r"error:",
+    r"exception:",
+    r"fatal:"
+]
+
+class LineClassifier:
+    """Finds every registered kind of marker in a line with one regex scan.
+
+    Each rule has a lowercase `trigger` (a regex without capturing groups)
+    and an optional `extract` pattern.
+    All triggers are compiled into a single alternation, so a line that
+    carries no marker (most of them) costs one scan of its lowercased text.
+    Only lines with a hit go on to identify the rule and run its extract
+    pattern at the hit position.
+    """
+
+    def __init__(self):
+        self._rules = []
+        self._scan = None
+        self._scan_folded = None
+
+    def register(self, kind, trigger, extract=None):
+        """Add a rule. With `extract`, the kind's value is its group 1; without, it is True."""
+        self._rules.append((kind, re.compile(trigger, re.IGNORECASE), re.compile(extract, re.IGNORECASE) if extract else None))
+        self._scan = self._scan_folded = None
+        return self
+
+    def _compile(self):
+        # No capturing groups: sre scans a group-free alternation several
+        # times faster, and the rule behind a hit is looked up afterwards
+        source = "|".join(rule[1].pattern for rule in self._rules)
+        self._scan = re.compile(source)
+        self._scan_folded = re.compile(source, re.IGNORECASE)
+
+    def classify(self, line):
+        """Return {kind: value} for every kind found in `line`."""
+        if self._scan is None:
+            self._compile()
+        text = line.lower()
+        if len(text) == len(line):
+            positions = [m.start() for m in self._scan.finditer(text)]
+        else:
+            # Lowercasing changed the length of some non-ASCII character, so
+            # positions would not line up; scan the original text instead
+            text = line
+            positions = [m.start() for m in self._scan_folded.finditer(text)]
+        if not positions:
+            return {}
+
+        result = {}
+        # Rules are tried in registration order, so within a kind the first
+        # rule wins and then the leftmost hit, as the old pattern loops did
+        for kind, trigger, extract in self._rules:
+            if kind in result:
+                continue
+            for start in positions:
+                if not trigger.match(text, start):
+                    continue
+                if extract is None:
+                    result[kind] = True
+                    break
+                match = extract.match(line, start)
+                if match:
+                    result[kind] = match.group(1).strip()
+                    break
+        return result
+
+def default_classifier():
+    classifier = LineClassifier()
+    for trigger, extract in STEP_RULES:
+        classifier.register("step", trigger, extract)
+    for pattern in RATE_LIMIT_PATTERNS:
+        classifier.register("rate_limit", pattern.lower())
+    for pattern in ERROR_PATTERNS:
+        classifier.register("error", pattern)
+    return classifier
+
+CLASSIFIER = default_classifier()
+
+def classify(line):
+    return CLASSIFIER.classify(line)
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+from collections import deque
+
+from loop_detector import LoopDetector
+
+TOP_K = 64  # Distinct messages counted per project
+FREQUENT_THRESHOLD = 5  # A message seen more often than this within one project is reported as frequent
+ATTEMPT_START = "Starting agent ("  # Controller record that opens a new attempt of a project
+RECENT_ERRORS = 50  # Error records kept verbatim for the post-mortem
+MAX_MESSAGE = 500  # Characters of a message kept as a counter key or in an error sample
+FINGERPRINT_BYTES = 256  # Leading bytes that identify a log file across critic runs
+READ_CHUNK = 1024 * 1024
+ERROR_LEVELS = ("ERROR", "WARNING", "CRITICAL")
+
+def message_key(msg):
+    """A message, or for a long one its head plus a digest of the whole, so long
+    messages that differ only near the end are not counted as repeats."""
+    msg = str(msg)
+    if len(msg) <= MAX_MESSAGE:
+        return msg
+    return f"{msg[:MAX_MESSAGE]}... [{hashlib.sha1(msg.encode(errors='replace')).hexdigest()[:12]}]"
+
+class SpaceSaving:
+    """Approximate top-K frequency counter (Metwally et al.) in O(k) memory.
+
+    At most `k` items are counted. A new item replaces the least frequent one
+    and inherits its count as `error`, so every count overestimates by at most
+    its error, and any item making up more than 1/k of the stream is kept.
+    Items are grouped in buckets by count, which makes every update O(1).
+    """
+
+    def __init__(self, k=TOP_K, entries=()):
+        self.k = k
+        self.counts = {}  # item -> [count, error]
+        self._buckets = {}  # count -> {item: None}, oldest first
+        self._min = 0
+        for item, count, error in entries:
+            self.counts[item] = [count, error]
+            self._buckets.setdefault(count, {})[item] = None
+        if self.counts:
+            self._min = min(self._buckets)
+
+    def _move(self, item, old, new):
+        if old:
+            bucket = self._buckets[old]
+            del bucket[item]
+            if not bucket:
+                del self._buckets[old]
+                if self._min == old:
+                    self._min = new
+        self._buckets.setdefault(new, {})[item] = None
+
+    def add(self, item):
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += 1
+            self._move(item, entry[0] - 1, entry[0])
+            return
+        if len(self.counts) < self.k:
+            self.counts[item] = [1, 0]
+            self._move(item, 0, 1)
+            self._min = 1
+            return
+        floor = self._min
+        bucket = self._buckets[floor]
+        victim = next(iter(bucket))
+        del bucket[victim], self.counts[victim]
+        if not bucket:
+            del self._buckets[floor]
+            self._min = floor + 1
+        self.counts[item] = [floor + 1, floor]
+        self._buckets.setdefault(floor + 1, {})[item] = None
+
+    def top(self, min_count=0):
+        """{item: count} of items certainly seen more than min_count times, most frequent first."""
+        ranked = sorted(self.counts.items(), key=lambda kv: -kv[1][0])
+        return {item: count for item, (count, error) in ranked if count - error > min_count}
+
+    def entries(self):
+        return [[item, count, error] for item, (count, error) in self.counts.items()]
+
+class LogAnalyzer:
+    """Streaming analysis of controller.log that resumes where the last run stopped.
+
+    The state is a byte offset plus rolling aggregates: per-project record and
+    level counts, a Space-Saving counter of each project's messages, a
+    `LoopDetector` over each project's records (restarted with every attempt)
+    and the most recent error records. `update()` reads only complete lines past the
+    offset. When the log was replaced (a fresh controller run deletes it) or
+    truncated, the aggregates start over, so a report always describes the
+    current file.
+    """
+
+    def __init__(self, state=None, k=TOP_K):
+        state = state or {}
+        self.k = k
+        self.offset = state.get("offset", 0)
+        self.fingerprint = state.get("fingerprint")
+        self.records = state.get("records", 0)
+        self.projects = {}
+        for name, info in state.get("projects", {}).items():
+            self.projects[name] = {"records": info["records"], "levels": info["levels"],
+                                   "messages": SpaceSaving(k, info["messages"]),
+                                   "loops": LoopDetector(state=info.get("loops"))}
+        self.recent_errors = deque(state.get("recent_errors", []), maxlen=RECENT_ERRORS)
+
+    @classmethod
+    def load(cls, path, k=TOP_K):
+        """Restore from a checkpoint file; a missing or unreadable one starts from scratch."""
+        try:
+            with open(path, "r") as f:
+                return cls(json.load(f), k)
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(k=k)
+
+    def save(self, path):
+        state = {
+            "offset": self.offset,
+            "fingerprint": self.fingerprint,
+            "records": self.records,
+            "projects": {name: {"records": p["records"], "levels": p["levels"], "messages": p["messages"].entries(),
+                                "loops": p["loops"].to_state()}
+                         for name, p in self.projects.items()},
+            "recent_errors": list(self.recent_errors)
+        }
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
+
+    def reset(self):
+        self.offset = 0
+        self.fingerprint = None
+        self.records = 0
+        self.projects = {}
+        self.recent_errors.clear()
+
+    def _same_file(self, head, size):
+        if self.fingerprint is None:
+            return self.offset == 0
+        length, digest = self.fingerprint
+        return size >= self.offset and len(head) >= length and hashlib.sha1(head[:length]).hexdigest() == digest
+
+    def update(self, log_file):
+        """Fold the log records appended since the last call into the aggregates.
+        Returns the number of new records."""
+        with open(log_file, "rb") as f:
+            head = f.read(FINGERPRINT_BYTES)
+            if not self._same_file(head, os.fstat(f.fileno()).st_size):
+                self.reset()
+            before = self.records
+            f.seek(self.offset)
+            pending = b""
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b"\n")
+                # A trailing partial line may still be being written; it is read next time
+                pending = lines.pop()
+                for line in lines:
+                    self.offset += len(line) + 1
+                    self._add(line)
+        if self.fingerprint is None or self.fingerprint[0] < min(len(head), self.offset):
+            length = min(len(head), self.offset)
+            self.fingerprint = [length, hashlib.sha1(head[:length]).hexdigest()]
+        return self.records - before
+
+    def _add(self, line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(entry, dict):
+            return
+        self.records += 1
+        proj = entry.get("project")
+        msg = entry.get("message")
+        level = entry.get("level")
+        if level in ERROR_LEVELS:
+            if isinstance(msg, str) and len(msg) > MAX_MESSAGE:
+                entry = dict(entry, message=message_key(msg))
+            self.recent_errors.append(entry)
+        if proj:
+            stats = self.projects.get(proj)
+            if stats is None:
+                stats = self.projects[proj] = {"records": 0, "levels": {}, "messages": SpaceSaving(self.k),
+                                               "loops": LoopDetector()}
+            stats["records"] += 1
+            if level:
+                stats["levels"][level] = stats["levels"].get(level, 0) + 1
+            if msg:
+                stats["messages"].add(message_key(msg))
+                msg = str(msg)
+                if msg.startswith(ATTEMPT_START):
+                    stats["loops"].reset()
+                else:
+                    stats["loops"].feed(msg)
+
+    def report(self, frequent_threshold=FREQUENT_THRESHOLD):
+        """Aggregates in the shape the critic's prompt uses."""
+        loops, frequent = {}, {}
+        for name, stats in self.projects.items():
+            if stats["loops"].loops:
+                loops[name] = stats["loops"].loops
+            repeated = stats["messages"].top(frequent_threshold)
+            if repeated:
+                frequent[name] = repeated
+        return {
+            "records": self.records,
+            "errors": list(self.recent_errors),
+            "projects": {name: {"records": s["records"], **s["levels"]} for name, s in self.projects.items()},
+            "loops": loops,
+            "frequent": frequent
+        }
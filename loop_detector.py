@@ -0,0 +1,133 @@
+import re
+from collections import deque
+
+MAX_PERIOD = 8  # Longest cycle, in lines, that is looked for
+LOOP_REPEATS = 5  # Times a cycle of two or more lines must repeat back to back
+SINGLE_LINE_REPEATS = 50  # Times one line must repeat; progress output legitimately repeats
+SIMILARITY = 0.7  # Jaccard similarity of token sets above which two lines are near-duplicates
+MAX_CLUSTERS = 64  # Recent distinct lines kept for near-duplicate matching
+MAX_LOOPS = 10  # Loops remembered per detector
+EXAMPLE_CHARS = 200
+
+# Volatile tokens, most specific first; each becomes a placeholder
+VOLATILE = re.compile(
+    r"(?P<time>\d{4}-\d\d-\d\d[t ]\d\d:\d\d(?::\d\d(?:\.\d+)?)?|\b\d\d:\d\d(?::\d\d(?:\.\d+)?)?\b)"
+    r"|(?P<path>(?:[\w.-]*/)+[\w.-]+)"
+    r"|(?P<file>\b[\w-]+\.[a-z][a-z0-9]{0,4}\b)"
+    r"|(?P<hex>\b0x[0-9a-f]+\b|\b[0-9a-f]{8,}\b)"
+    r"|(?P<num>\d+(?:\.\d+)?)"
+)
+
+def normalize(line):
+    """Lowercase a line and replace timestamps, paths, file names, hex ids and numbers with placeholders."""
+    text = VOLATILE.sub(lambda m: f"<{m.lastgroup}>", line.strip().lower())
+    return " ".join(text.split())
+
+def similarity(a, b):
+    """Jaccard similarity of two token sets."""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def _primitive(cycle):
+    """False if the cycle is itself a repetition of a shorter one."""
+    p = len(cycle)
+    return not any(p % d == 0 and cycle == cycle[d:] + cycle[:d] for d in range(1, p))
+
+class LoopDetector:
+    """Streaming detector of an agent repeating itself, for one output stream.
+
+    Every line is normalized, then mapped to a cluster of near-duplicates: the
+    same normalized text, or one of the `MAX_CLUSTERS` most recent clusters
+    whose token set is at least `SIMILARITY` similar. On short lines this is
+    both cheaper and more reliable than a simhash. For each period p up to `max_period`, a counter holds how many
+    consecutive lines matched the cluster p lines earlier, which spots a cycle
+    of p lines repeating back to back in O(max_period) per line. A cycle is a
+    loop once it repeated `repeats` times (`single_repeats` for one line).
+    """
+
+    def __init__(self, max_period=MAX_PERIOD, repeats=LOOP_REPEATS, single_repeats=SINGLE_LINE_REPEATS, state=None):
+        self.max_period = max_period
+        self.repeats = repeats
+        self.single_repeats = single_repeats
+        state = state or {}
+        self._next_id = state.get("next_id", 0)
+        # id -> (token set, example); insertion order is recency
+        self._clusters = {cid: (frozenset(text.split()), text) for cid, text in state.get("clusters", [])}
+        self._known = {}  # normalized text -> cluster id
+        self._recent = deque(state.get("recent", []), maxlen=max_period)  # cluster ids of the last lines
+        self._matches = state.get("matches", [0] * (max_period + 1))
+        self._active = state.get("active")  # Period of the last loop while it keeps repeating
+        self.loops = state.get("loops", [])
+
+    def to_state(self):
+        return {
+            "next_id": self._next_id,
+            "clusters": [[cid, text] for cid, (_, text) in self._clusters.items()],
+            "recent": list(self._recent),
+            "matches": self._matches,
+            "active": self._active,
+            "loops": self.loops
+        }
+
+    def reset(self):
+        """Forget the stream position, e.g. when a new attempt starts."""
+        self._recent.clear()
+        self._matches = [0] * (self.max_period + 1)
+        self._active = None
+
+    def _cluster(self, text):
+        cid = self._known.get(text)
+        if cid is not None and cid in self._clusters:
+            # Keep recently seen clusters away from eviction
+            self._clusters[cid] = self._clusters.pop(cid)
+            return cid
+        tokens = frozenset(text.split())
+        for other, (other_tokens, _) in self._clusters.items():
+            if similarity(tokens, other_tokens) >= SIMILARITY:
+                cid = other
+                break
+        else:
+            cid = self._next_id
+            self._next_id += 1
+        self._clusters[cid] = self._clusters.pop(cid, None) or (tokens, text[:EXAMPLE_CHARS])
+        if len(self._clusters) > MAX_CLUSTERS:
+            del self._clusters[next(iter(self._clusters))]
+        if len(self._known) > MAX_CLUSTERS * 16:
+            self._known.clear()
+        self._known[text] = cid
+        return cid
+
+    def feed(self, line):
+        """Add one output line. Returns the loop when this line confirms a new one, else None."""
+        text = normalize(line)
+        if not text:
+            return None
+        cid = self._cluster(text)
+        recent = self._recent
+        for p in range(1, self.max_period + 1):
+            if len(recent) >= p and recent[-p] == cid:
+                self._matches[p] += 1
+            else:
+                self._matches[p] = 0
+        recent.append(cid)
+
+        if self._active is not None:
+            period = self._active
+            if self._matches[period] > 0:
+                self.loops[-1]["repeats"] = self._matches[period] // period + 1
+                return None
+            self._active = None
+        for p in range(1, min(self.max_period, len(recent)) + 1):
+            needed = self.single_repeats if p == 1 else self.repeats
+            if self._matches[p] < p * (needed - 1):
+                continue
+            cycle = list(recent)[-p:]
+            if not _primitive(cycle):
+                continue
+            loop = {"period": p, "repeats": needed,
+                    "lines": [self._clusters[c][1] if c in self._clusters else "?" for c in cycle]}
+            self.loops.append(loop)
+            if len(self.loops) > MAX_LOOPS:
+                self.loops.pop(0)
+            self._active = p
+            return loop
+        return None
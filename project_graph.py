@@ -0,0 +1,58 @@
+from collections import deque
+
+def dependencies(project):
+    """Names a project depends on; `depends_on` may be a name or a list of names."""
+    deps = project.get("depends_on") or []
+    if isinstance(deps, str):
+        deps = [deps]
+    return list(dict.fromkeys(deps))
+
+def topological_order(projects):
+    """Validate the `depends_on` graph of a batch in O(projects + edges).
+
+    Returns the project names in an order where every project follows its
+    dependencies, and a map from each name to the names that depend on it.
+    Raises ValueError for duplicate names, unknown dependencies or cycles.
+    """
+    dependents = {}
+    for project in projects:
+        if project["name"] in dependents:
+            raise ValueError(f"Duplicate project name '{project['name']}' in projects.json")
+        dependents[project["name"]] = []
+
+    indegree = {}
+    for project in projects:
+        name = project["name"]
+        deps = dependencies(project)
+        for dep in deps:
+            if dep not in dependents:
+                raise ValueError(f"Project '{name}' depends on unknown project '{dep}'")
+            dependents[dep].append(name)
+        indegree[name] = len(deps)
+
+    # Kahn's algorithm: whatever never reaches indegree 0 is on or behind a cycle
+    ready = deque(name for name, count in indegree.items() if count == 0)
+    order = []
+    while ready:
+        name = ready.popleft()
+        order.append(name)
+        for dependent in dependents[name]:
+            indegree[dependent] -= 1
+            if indegree[dependent] == 0:
+                ready.append(dependent)
+    if len(order) < len(indegree):
+        stuck = [name for name, count in indegree.items() if count > 0]
+        shown = ", ".join(stuck[:10]) + (", ..." if len(stuck) > 10 else "")
+        raise ValueError(f"Dependency cycle among {len(stuck)} projects: {shown}")
+    return order, dependents
+
+def downstream_costs(order, dependents, costs):
+    """Cost of the longest chain of dependents after each project.
+
+    Ranking by it runs the head of the critical path first. Projects nothing
+    depends on get 0, so a batch without dependencies keeps its order.
+    """
+    tail = {}
+    for name in reversed(order):
+        tail[name] = max((costs[d] + tail[d] for d in dependents[name]), default=0)
+    return tail
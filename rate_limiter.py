@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+import tempfile
+from contextlib import contextmanager
+
+# One bucket per user and host, shared by every controller and critic process
+BUCKET_FILE = os.path.join(tempfile.gettempdir(), f"gemini-rate-bucket-{os.getuid()}.json")
+LAUNCH_RATE = 20  # Agent launches per minute across all processes
+LAUNCH_BURST = 5  # Launches allowed back-to-back when the bucket is full
+SHARED_BACKOFF = 10  # Seconds every process pauses launches after any rate limit
+
+# Output that means the Gemini quota pushed back
+RATE_LIMIT_PATTERNS = [
+    r"exhausted your capacity",
+    r"rate limit reached",
+    r"quota exceeded",
+    r"429 Too Many Requests",
+    r"Resource exhausted"
+]
+
+_RATE_LIMIT_RE = re.compile("|".join(RATE_LIMIT_PATTERNS), re.IGNORECASE)
+
+def is_rate_limited(text):
+    return _RATE_LIMIT_RE.search(text) is not None
+
+class SharedTokenBucket:
+    """Token bucket whose state lives in a flock-protected file.
+
+    Every process on the host that talks to the same Gemini quota draws from
+    it before launching work. `penalize()` empties the bucket and blocks it
+    for a while, so a rate limit seen by one process pauses all of them. The
+    `events` counter lets each process notice rate limits seen by the others.
+    """
+
+    def __init__(self, path=BUCKET_FILE, rate=LAUNCH_RATE / 60.0, capacity=LAUNCH_BURST):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+
+    @contextmanager
+    def _locked_state(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                raw = f.read()
+                state = json.loads(raw) if raw else {}
+            except ValueError:
+                # A writer died mid-update; start from a full bucket
+                state = {}
+            now = time.time()
+            tokens = state.get("tokens", self.capacity)
+            updated = state.get("updated", now)
+            state["tokens"] = min(self.capacity, tokens + max(0, now - updated) * self.rate)
+            state["updated"] = now
+            state.setdefault("blocked_until", 0)
+            state.setdefault("events", 0)
+            yield state
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+            f.flush()
+
+    def try_acquire(self):
+        """Take a token if one is available. Returns (seconds to wait, events);
+        a wait of 0 means the token was taken."""
+        with self._locked_state() as state:
+            now = state["updated"]
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now, state["events"]
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0, state["events"]
+            return (1 - state["tokens"]) / self.rate, state["events"]
+
+    def acquire(self):
+        """Block until a token is taken. Returns the shared rate-limit event count."""
+        while True:
+            wait, events = self.try_acquire()
+            if wait <= 0:
+                return events
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self):
+        while True:
+            wait, events = self.try_acquire()
+            if wait <= 0:
+                return events
+            await asyncio.sleep(min(wait, 1.0))
+
+    def penalize(self, backoff=SHARED_BACKOFF):
+        """Record a rate limit: drain the bucket and pause every process for `backoff` seconds."""
+        with self._locked_state() as state:
+            state["tokens"] = 0
+            state["blocked_until"] = max(state["blocked_until"], state["updated"] + backoff)
+            state["events"] += 1
+            return state["events"]
+
+    def snapshot(self):
+        with self._locked_state() as state:
+            return dict(state)
@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".cache", "results")
+CACHE_MAX_MB = 500
+# Control files that never belong to a project's result
+IGNORED_FILES = {".done", ".gemini", "__pycache__", ".git"}
+FICLONE = 0x40049409  # Linux ioctl that reflinks one file onto another
+
+def normalize(text):
+    """Collapse whitespace so cosmetic edits do not change the cache key."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def cache_key(task, guidelines, instructions):
+    payload = json.dumps({
+        "task": normalize(task),
+        "guidelines": normalize(guidelines),
+        "instructions": normalize(instructions)
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+def _link_file(src, dst, mode):
+    """Materialize one file, falling back to a plain copy when links are unsupported."""
+    try:
+        if mode == "hardlink":
+            os.link(src, dst)
+            return
+        if mode == "reflink":
+            _reflink(src, dst)
+            return
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+
+def _copy_tree(src_dir, dst_dir, mode):
+    size = 0
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if d not in IGNORED_FILES]
+        rel = os.path.relpath(root, src_dir)
+        target = os.path.normpath(os.path.join(dst_dir, rel))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            if name in IGNORED_FILES:
+                continue
+            dst = os.path.join(target, name)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            _link_file(os.path.join(root, name), dst, mode)
+            size += os.path.getsize(dst)
+    return size
+
+class ResultCache:
+    """Content-addressed store of finished project outputs.
+
+    Entries live in `<cache_dir>/<key>/files` with a `meta.json` beside them.
+    An entry's directory mtime is its last use, and eviction removes the least
+    recently used entries once the total size exceeds `max_bytes`. Hardlinks
+    share inodes with the cache, so an agent resuming a restored project would
+    edit the cached copy in place. Reflinks (copy-on-write) are used where the
+    filesystem supports them, with a plain copy as the fallback.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024, link_mode="reflink"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        entry = self._entry(key)
+        if not os.path.exists(os.path.join(entry, "meta.json")):
+            return None
+        os.utime(entry)  # Mark as recently used
+        return entry
+
+    def materialize(self, key, project_dir):
+        """Copy a cached result into project_dir. Returns False on a miss."""
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        _copy_tree(os.path.join(entry, "files"), project_dir, self.link_mode)
+        return True
+
+    def store(self, key, project_dir, project=None):
+        if self.lookup(key) is not None:
+            return
+        staging = tempfile.mkdtemp(dir=self.cache_dir, prefix=".staging-")
+        try:
+            # Stored results are always independent copies of the project files
+            size = _copy_tree(project_dir, os.path.join(staging, "files"), "copy")
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({"key": key, "project": project, "size": size, "created": time.time()}, f)
+            os.rename(staging, self._entry(key))
+        except OSError:
+            # Lost a race with another writer for the same key, or the copy failed
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            if key.startswith(".staging-"):
+                # Left behind by a writer that crashed mid-store
+                if os.path.getmtime(entry) < time.time() - 3600:
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            try:
+                with open(os.path.join(entry, "meta.json"), "r") as f:
+                    size = json.load(f)["size"]
+                entries.append((os.path.getmtime(entry), size, entry))
+                total += size
+            except (OSError, ValueError, KeyError):
+                continue
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(BASE_DIR, "runs")
+
+def new_run_id():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+def journal_path(run_id, runs_dir=None):
+    return os.path.join(runs_dir or RUNS_DIR, f"{run_id}.journal")
+
+class RunJournal:
+    """Append-only, fsynced record of the scheduler decisions of one run.
+
+    Each line is a JSON event. Every event is on disk before the controller
+    acts on it, so `replay()` can rebuild the queue after a crash: which
+    projects finished, how many retries each one used, when backed-off
+    projects may run again, and the last concurrency limit.
+    """
+
+    def __init__(self, run_id, runs_dir=None):
+        self.run_id = run_id
+        self.path = journal_path(run_id, runs_dir)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a")
+
+    def append(self, event, **fields):
+        entry = {"ts": time.time(), "event": event}
+        entry.update(fields)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+def replay(run_id, runs_dir=None):
+    """Fold a journal into the state needed to resume its run."""
+    path = journal_path(run_id, runs_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No journal for run {run_id} at {path}")
+
+    state = {
+        "run_id": run_id,
+        "projects": [],
+        "limit": None,
+        "retries": {},
+        "not_before": {},
+        "finished": {},
+        "interrupted": set()
+    }
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn final line from a crash mid-write
+                continue
+            event = entry.get("event")
+            name = entry.get("project")
+            if event == "run_start":
+                state["projects"] = entry["projects"]
+                state["limit"] = entry.get("limit")
+            elif event == "concurrency":
+                state["limit"] = entry["limit"]
+            elif event == "attempt_start":
+                state["interrupted"].add(name)
+            elif event == "attempt_end":
+                state["interrupted"].discard(name)
+            elif event == "requeue":
+                state["retries"][name] = entry["retries"]
+                state["not_before"][name] = entry["not_before"]
+            elif event == "finished":
+                state["finished"][name] = entry["status"]
+    # An attempt cut off by the crash never finished, so it does not cost a retry
+    state["interrupted"] -= set(state["finished"])
+    return state
@@ -0,0 +1,161 @@
+import os
+import time
+import sqlite3
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DB = os.path.join(BASE_DIR, "run_state.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    step TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    exit_code INTEGER,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration REAL,
+    exit_code INTEGER,
+    outcome TEXT,
+    max_idle REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_project ON attempts(project);
+"""
+
+# Statuses after which a project needs no further attempts in this run
+TERMINAL_STATUSES = ("Done", "Failed", "Timed Out", "Error")
+
+class StateStore:
+    """Transactional record of per-project status and attempt history.
+
+    This is the single source of truth for completion: the controller, the
+    critic and the manifest generator all read it instead of walking
+    `projects/` for `.done` markers. One connection is shared by the threads
+    of a process; WAL mode lets other processes read while the controller
+    writes.
+    """
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Databases created before max_idle existed
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(attempts)")}
+        if "max_idle" not in columns:
+            self._conn.execute("ALTER TABLE attempts ADD COLUMN max_idle REAL")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            with self._conn:
+                return self._conn.execute(sql, params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM projects WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def is_done(self, name):
+        row = self.get(name)
+        return row is not None and row["status"] == "Done"
+
+    def all_projects(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM projects ORDER BY name").fetchall()
+        return {row["name"]: dict(row) for row in rows}
+
+    def set_status(self, name, status, step=None, exit_code=None):
+        now = time.time()
+        finished_at = now if status in TERMINAL_STATUSES else None
+        self._execute(
+            """INSERT INTO projects (name, status, step, exit_code, finished_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET
+                   status = excluded.status,
+                   step = COALESCE(excluded.step, step),
+                   exit_code = COALESCE(excluded.exit_code, exit_code),
+                   finished_at = excluded.finished_at,
+                   updated_at = excluded.updated_at""",
+            (name, status, step, exit_code, finished_at, now))
+
+    def start_attempt(self, name, attempt):
+        """Record the start of an attempt (1-based) and return its id."""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    """INSERT INTO projects (name, status, attempts, started_at, updated_at)
+                       VALUES (?, 'Running', ?, ?, ?)
+                       ON CONFLICT(name) DO UPDATE SET
+                           status = 'Running',
+                           attempts = attempts + 1,
+                           started_at = COALESCE(started_at, excluded.started_at),
+                           finished_at = NULL,
+                           updated_at = excluded.updated_at""",
+                    (name, 1, now, now))
+                cursor = self._conn.execute(
+                    "INSERT INTO attempts (project, attempt, started_at) VALUES (?, ?, ?)",
+                    (name, attempt, now))
+        return cursor.lastrowid
+
+    def finish_attempt(self, attempt_id, exit_code, outcome, max_idle=None):
+        """Close an attempt. `max_idle` is the longest stretch without agent output, in seconds."""
+        now = time.time()
+        self._execute(
+            """UPDATE attempts SET finished_at = ?, duration = ? - started_at, exit_code = ?, outcome = ?, max_idle = ?
+               WHERE id = ?""",
+            (now, now, exit_code, outcome, max_idle, attempt_id))
+
+    def attempt_history(self, name=None):
+        sql = "SELECT * FROM attempts"
+        params = ()
+        if name is not None:
+            sql += " WHERE project = ?"
+            params = (name,)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql + " ORDER BY id", params)]
+
+    def attempt_stats(self):
+        """Per-project totals over finished attempts, for duration and failure estimates.
+
+        Rate limits and lost hedge races say nothing about the task itself, and
+        attempts inside a batch last as long as the whole batch, so they are
+        left out.
+        """
+        success = "outcome IN ('done', 'hedge_won')"
+        sql = f"""SELECT project,
+                         COUNT(*) AS attempts,
+                         SUM({success}) AS successes,
+                         AVG(CASE WHEN {success} THEN duration END) AS success_duration,
+                         AVG(duration) AS mean_duration
+                  FROM attempts
+                  WHERE finished_at IS NOT NULL AND outcome NOT IN ('rate_limited', 'hedge_lost', 'batched', 'batch_failed')
+                  GROUP BY project"""
+        with self._lock:
+            return {row["project"]: dict(row) for row in self._conn.execute(sql)}
+
+def load_project_states(path=STATE_DB):
+    """Read every project row without creating the database if it does not exist."""
+    if not os.path.exists(path):
+        return {}
+    store = StateStore(path)
+    try:
+        return store.all_projects()
+    finally:
+        store.close()
@@ -2,8 +2,59 @@ import unittest
 import os
 import json
 import shutil
+import asyncio
+import stat
+import time
+import io
+import sys
+import subprocess
+import sqlite3
+import controller
 from controller import atomic_write, extract_step, check_rate_limit
 from generate_manifest import generate_manifest
+from rate_limiter import SharedTokenBucket
+from state_store import StateStore
+import run_journal
+from result_cache import ResultCache, cache_key
+from fs_watch import ProjectWatcher
+from line_classifier import LineClassifier, classify
+from hedging import Hedger
+from project_graph import topological_order, downstream_costs
+from timeouts import TimeoutPolicy
+import host_monitor
+from agent_sandbox import AgentLimits
+from log_analyzer import LogAnalyzer, SpaceSaving
+
+FAKE_GEMINI = """#!/bin/sh
+echo "I will create the game."
+echo "Creating index.html..."
+printf '<html><body>%0200d</body></html>' 0 > index.html
+"""
+
+def setUpModule():
+    # Keep test telemetry out of the real controller.log
+    global _originals
+    _originals = (controller.LOG_FILE, controller.STATE_DB)
+    controller.LOG_FILE = os.path.abspath("test_controller.log")
+    controller.STATE_DB = os.path.abspath("test_state.db")
+
+def tearDownModule():
+    controller.LOG_FILE, controller.STATE_DB = _originals
+    if controller.state_store is not None:
+        controller.state_store.close()
+        controller.state_store = None
+    for path in ["test_controller.log", "test_state.db", "test_state.db-wal", "test_state.db-shm"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+def install_fake_gemini(bin_dir, script=FAKE_GEMINI):
+    """Put a stand-in `gemini` executable first on PATH."""
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "gemini")
+    with open(path, "w") as f:
+        f.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = os.path.abspath(bin_dir) + os.pathsep + os.environ["PATH"]
 
 class TestOrchestrator(unittest.TestCase):
     def setUp(self):
@@ -35,6 +86,30 @@ class TestOrchestrator(unittest.TestCase):
         self.assertTrue(check_rate_limit("429 Too Many Requests"))
         self.assertFalse(check_rate_limit("Success"))
 
+    def test_classifier_matches_pattern_priority(self):
+        # The first step rule wins even when a later rule matches further left
+        self.assertEqual(extract_step("Reading notes. I will write app.js. Then test"), "I will write app.js.")
+        self.assertEqual(extract_step("I will keep going"), None)
+        found = classify("Error: quota exceeded while Creating page.html")
+        self.assertEqual(found, {"step": "Creating page.html", "rate_limit": True, "error": True})
+        self.assertEqual(classify("plain output"), {})
+
+    def test_classifier_custom_rules(self):
+        classifier = LineClassifier().register("test", r"ran \d+ tests", r"(Ran\s+(\d+)\s+tests)")
+        self.assertEqual(classifier.classify("OK: Ran 12 tests in 0.1s"), {"test": "Ran 12 tests"})
+        # Non-ASCII text whose lowercase changes length still lines up
+        self.assertEqual(classifier.classify("İİ ran 3 tests"), {"test": "ran 3 tests"})
+
+    def test_log_writer_flushes_on_close(self):
+        writer = controller.LogWriter(self.test_file, flush_interval=60).start()
+        for i in range(100):
+            writer.write(json.dumps({"n": i}) + "\n")
+        writer.close()
+        writer.close()
+        with open(self.test_file, "r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual([json.loads(l)["n"] for l in lines], list(range(100)))
+
     def test_generate_manifest(self):
         # Setup mock projects
         p1 = os.path.join(self.test_dir, "proj1")
@@ -46,6 +121,7 @@ class TestOrchestrator(unittest.TestCase):
         original_dir = generate_manifest.PROJECTS_DIR
         generate_manifest.PROJECTS_DIR = self.test_dir
         generate_manifest.MANIFEST_FILE = "test_manifest.json"
+        generate_manifest.STATE_DB = "missing_state.db"
         
         try:
             generate_manifest.generate_manifest()
@@ -59,5 +135,742 @@ class TestOrchestrator(unittest.TestCase):
             if os.path.exists("test_manifest.json"):
                 os.remove("test_manifest.json")
 
+class TestConcurrencyController(unittest.TestCase):
+    def test_rate_limit_shrinks_even_when_all_slots_held(self):
+        cc = controller.ConcurrencyController(4, cooldown=10)
+        for _ in range(4):
+            cc.acquire()
+        self.assertTrue(cc.on_rate_limit())
+        self.assertEqual(cc.limit, 2)
+        # A burst of 429s inside the cooldown counts once
+        self.assertFalse(cc.on_rate_limit())
+        self.assertEqual(cc.limit, 2)
+        cc.release()
+        cc.release()
+        cc.release()
+        self.assertEqual(cc.snapshot()["in_flight"], 1)
+
+    def test_probes_back_up_after_quiet_period(self):
+        cc = controller.ConcurrencyController(4, probe_interval=0.05, cooldown=0)
+        cc.on_rate_limit()
+        cc.on_rate_limit()
+        self.assertEqual(cc.limit, 1)
+        cc.acquire()
+        cc.acquire()  # Blocks until the quiet period lets the limit grow
+        self.assertEqual(cc.limit, 2)
+        self.assertIn("probe", cc.snapshot()["last_reason"])
+        self.assertEqual(cc.history[-1]["reason"], cc.last_reason)
+
+    def test_async_waiters_wake_on_release(self):
+        cc = controller.ConcurrencyController(1, probe_interval=60)
+
+        async def scenario():
+            await cc.acquire_async()
+            waiter = asyncio.ensure_future(cc.acquire_async())
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            cc.release()
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+        self.assertEqual(cc.in_flight, 1)
+
+class TestHostAdmission(unittest.TestCase):
+    class FakeHost:
+        interval = 0.05
+
+        def __init__(self):
+            self.reason = "load 9.0 on 1 CPUs"
+
+        def saturated(self):
+            return self.reason
+
+    def test_saturated_host_holds_agents_back(self):
+        host = self.FakeHost()
+        cc = controller.ConcurrencyController(1, max_limit=4, probe_interval=0, host=host)
+        cc.acquire()  # The first agent is always admitted
+        with cc._cond:
+            cc._maybe_increase_locked(time.time())
+        self.assertEqual(cc.limit, 1)  # No probing while saturated
+        self.assertEqual(cc.snapshot()["host_blocked"], host.reason)
+        host.reason = None
+        with cc._cond:
+            cc._maybe_increase_locked(time.time())
+        self.assertEqual(cc.limit, 2)
+        self.assertTrue(cc.try_acquire())
+        host.reason = "1 MB available"
+        cc.release()
+        self.assertFalse(cc.try_acquire())
+
+    def test_monitor_reads_proc(self):
+        if not os.path.exists("/proc/loadavg"):
+            self.skipTest("no /proc")
+        rss = host_monitor.group_rss([os.getpgrp()])
+        self.assertGreater(rss[os.getpgrp()], 0)
+        monitor = host_monitor.HostMonitor(max_load_per_cpu=1e9, min_free_mb=0)
+        self.assertIsNone(monitor.saturated())
+        monitor = host_monitor.HostMonitor(max_load_per_cpu=1e9, min_free_mb=1e9)
+        self.assertIn("MB available", monitor.saturated())
+
+class TestAgentLimits(unittest.TestCase):
+    def test_rlimit_fallback(self):
+        limits = AgentLimits(memory_mb=512, cpus=1, use_cgroups=False)
+        self.assertEqual(limits.mode, "rlimit")
+        sandbox = limits.sandbox("p", timeout=30)
+        out = subprocess.run(["sh", "-c", "ulimit -d; ulimit -t"], capture_output=True, text=True,
+                             preexec_fn=sandbox.preexec).stdout.split()
+        self.assertEqual(out, ["524288", "30"])
+        self.assertEqual(AgentLimits().mode, "off")
+
+    def test_cgroup_files(self):
+        parent = os.path.abspath("test_cgroup")
+        os.makedirs(parent, exist_ok=True)
+        self.addCleanup(shutil.rmtree, parent)
+        with open(os.path.join(parent, "cgroup.controllers"), "w") as f:
+            f.write("cpuset cpu io memory pids\n")
+        limits = AgentLimits(memory_mb=64, cpus=0.5, pids=10, parent=parent)
+        self.assertEqual(limits.mode, "cgroup")
+        with open(os.path.join(parent, "cgroup.subtree_control")) as f:
+            self.assertEqual(f.read(), "+memory +cpu +pids")
+        sandbox = limits.sandbox("p", timeout=30)
+        self.assertEqual(os.path.dirname(sandbox.cgroup), parent)
+        self.assertEqual(sandbox.rlimits, [])
+        expected = {"memory.max": "67108864", "cpu.max": "50000 100000", "pids.max": "10"}
+        for name, value in expected.items():
+            with open(os.path.join(sandbox.cgroup, name)) as f:
+                self.assertEqual(f.read(), value)
+        # Without any controller to delegate, the limits fall back to rlimits
+        with open(os.path.join(parent, "cgroup.controllers"), "w") as f:
+            f.write("cpuset io\n")
+        self.assertEqual(AgentLimits(memory_mb=64, parent=parent).mode, "rlimit")
+
+class TestLogAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.log = os.path.abspath("test_analyzer.log")
+        self.state = os.path.abspath("test_analyzer.json")
+
+    def tearDown(self):
+        for path in (self.log, self.state):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write(self, lines, mode="a"):
+        with open(self.log, mode) as f:
+            f.write(lines)
+
+    def record(self, message, project="p", level="INFO"):
+        return json.dumps({"timestamp": "t", "level": level, "project": project, "message": message}) + "\n"
+
+    def test_resumes_from_checkpoint(self):
+        self.write(self.record("Thinking...") * 6 + self.record("boom", level="ERROR") + "not json\n", mode="w")
+        analyzer = LogAnalyzer.load(self.state)
+        self.assertEqual(analyzer.update(self.log), 7)
+        analyzer.save(self.state)
+        self.assertEqual(analyzer.report()["loops"], {"p": {"Thinking...": 6}})
+        # A half-written record is left for the next run
+        partial = self.record("Thinking...", project="q")
+        self.write(self.record("Thinking...") + partial[:10])
+        analyzer = LogAnalyzer.load(self.state)
+        self.assertEqual(analyzer.update(self.log), 1)
+        analyzer.save(self.state)
+        self.write(partial[10:])
+        analyzer = LogAnalyzer.load(self.state)
+        self.assertEqual(analyzer.update(self.log), 1)
+        report = analyzer.report()
+        self.assertEqual(report["loops"], {"p": {"Thinking...": 7}})
+        self.assertEqual(report["projects"]["p"], {"records": 8, "INFO": 7, "ERROR": 1})
+        self.assertEqual([e["message"] for e in report["errors"]], ["boom"])
+        # A fresh controller run replaces the log; the aggregates start over
+        self.write(self.record("Started", project="r"), mode="w")
+        self.assertEqual(analyzer.update(self.log), 1)
+        self.assertEqual(list(analyzer.report()["projects"]), ["r"])
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        counter = SpaceSaving(k=4)
+        for i in range(1000):
+            counter.add("loop" if i % 3 == 0 else f"step {i}")
+        self.assertEqual(len(counter.counts), 4)
+        top = counter.top()
+        self.assertEqual(next(iter(top)), "loop")
+        self.assertGreaterEqual(top["loop"], 334)
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.abspath("test_store.db")
+        self.store = StateStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_attempts_and_status_survive_reopen(self):
+        attempt_id = self.store.start_attempt("snake", 1)
+        self.store.finish_attempt(attempt_id, 1, "rate_limited")
+        self.store.set_status("snake", "Retrying", step="Rate limited")
+        attempt_id = self.store.start_attempt("snake", 2)
+        self.store.finish_attempt(attempt_id, 0, "done")
+        self.store.set_status("snake", "Done", step="Task Completed Successfully", exit_code=0)
+        self.store.close()
+
+        self.store = StateStore(self.path)
+        row = self.store.get("snake")
+        self.assertEqual((row["status"], row["attempts"], row["exit_code"]), ("Done", 2, 0))
+        self.assertIsNotNone(row["finished_at"])
+        self.assertTrue(self.store.is_done("snake"))
+        self.assertEqual([a["outcome"] for a in self.store.attempt_history("snake")], ["rate_limited", "done"])
+
+    def test_legacy_done_marker_is_imported(self):
+        project_dir = os.path.abspath(os.path.join("test_projects_legacy", "old"))
+        os.makedirs(project_dir)
+        try:
+            with open(os.path.join(project_dir, ".done"), "w") as f:
+                f.write("2026-02-05")
+            original = controller.state_store
+            controller.state_store = self.store
+            try:
+                self.assertTrue(controller.is_project_complete(project_dir))
+            finally:
+                controller.state_store = original
+            self.assertTrue(self.store.is_done("old"))
+        finally:
+            shutil.rmtree("test_projects_legacy")
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        self.runs_dir = os.path.abspath("test_runs")
+
+    def tearDown(self):
+        shutil.rmtree(self.runs_dir, ignore_errors=True)
+
+    def test_replay_rebuilds_scheduler_state(self):
+        projects = [{"name": n, "task": "t"} for n in ["done", "backoff", "crashed", "fresh"]]
+        journal = run_journal.RunJournal("r1", self.runs_dir)
+        journal.append("run_start", projects=projects, limit=4)
+        journal.append("attempt_start", project="done", attempt=1)
+        journal.append("attempt_end", project="done", outcome="done", exit_code=0)
+        journal.append("finished", project="done", status="Done")
+        journal.append("attempt_start", project="backoff", attempt=1)
+        journal.append("attempt_end", project="backoff", outcome="rate_limited", exit_code=1)
+        journal.append("requeue", project="backoff", retries=1, not_before=time.time() + 30)
+        journal.append("concurrency", limit=2, reason="rate limit")
+        journal.append("attempt_start", project="crashed", attempt=1)
+        journal.close()
+        with open(journal.path, "a") as f:
+            f.write('{"ts": 1, "event": "attempt_st')  # torn by the crash
+
+        state = run_journal.replay("r1", self.runs_dir)
+        self.assertEqual([p["name"] for p in state["projects"]], ["done", "backoff", "crashed", "fresh"])
+        self.assertEqual(state["finished"], {"done": "Done"})
+        self.assertEqual(state["retries"], {"backoff": 1})
+        self.assertEqual(state["interrupted"], {"crashed"})
+        self.assertEqual(state["limit"], 2)
+
+    def test_missing_journal(self):
+        with self.assertRaises(FileNotFoundError):
+            run_journal.replay("nope", self.runs_dir)
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.abspath("test_cache_root")
+        os.makedirs(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_project(self, name, size):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.join(path, "assets"))
+        with open(os.path.join(path, "index.html"), "w") as f:
+            f.write("x" * size)
+        with open(os.path.join(path, "assets", "game.js"), "w") as f:
+            f.write("js")
+        with open(os.path.join(path, ".done"), "w") as f:
+            f.write("marker")
+        return path
+
+    def test_key_ignores_whitespace_only_changes(self):
+        self.assertEqual(cache_key("Make  a game", "g", "i\n"), cache_key("Make a game", "g", "i"))
+        self.assertNotEqual(cache_key("Make a game", "g", "i"), cache_key("Make a game", "g", "other"))
+
+    def test_store_materialize_and_lru_eviction(self):
+        cache = ResultCache(os.path.join(self.root, "cache"), max_bytes=2500)
+        cache.store("a", self.make_project("pa", 1000))
+        cache.store("b", self.make_project("pb", 1000))
+        os.utime(cache._entry("a"), (1, 1))
+        os.utime(cache._entry("b"), (2, 2))
+        self.assertIsNotNone(cache.lookup("a"))  # Touch a, so b is now the oldest
+        cache.store("c", self.make_project("pc", 1000))
+        self.assertIsNotNone(cache.lookup("a"))
+        self.assertIsNone(cache.lookup("b"))
+
+        target = os.path.join(self.root, "restored")
+        os.makedirs(target)
+        self.assertTrue(cache.materialize("a", target))
+        self.assertEqual(sorted(os.listdir(target)), ["assets", "index.html"])
+        self.assertFalse(cache.materialize("missing", target))
+
+class TestProjectWatcher(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.abspath("test_watch")
+        os.makedirs(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def check_watcher(self, use_inotify):
+        watcher = ProjectWatcher(self.path, use_inotify=use_inotify)
+        try:
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+            with open(os.path.join(self.path, "index.html"), "w") as f:
+                f.write("<body>")
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+        finally:
+            watcher.close()
+        return watcher
+
+    def test_inotify(self):
+        self.check_watcher(True)
+
+    def test_polling_fallback(self):
+        self.assertEqual(self.check_watcher(False).mode, "polling")
+
+class TestSharedTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.abspath("test_bucket.json")
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_instances_share_tokens_and_backoff(self):
+        # Two instances behave like two controller processes on one host
+        a = SharedTokenBucket(self.path, rate=0.001, capacity=2)
+        b = SharedTokenBucket(self.path, rate=0.001, capacity=2)
+        self.assertEqual(a.try_acquire()[0], 0)
+        self.assertEqual(b.try_acquire()[0], 0)
+        self.assertGreater(a.try_acquire()[0], 0)
+
+        c = SharedTokenBucket(self.path, rate=100, capacity=5)
+        self.assertEqual(c.penalize(backoff=30), 1)
+        wait, events = b.try_acquire()
+        self.assertGreater(wait, 20)
+        self.assertEqual(events, 1)
+
+    def test_corrupt_state_resets(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(SharedTokenBucket(self.path).try_acquire()[0], 0)
+
+class TestScheduler(unittest.TestCase):
+    def make_job(self, name):
+        return controller.Job({"name": name, "task": "t"}, "/tmp", ["gemini"])
+
+    def test_backoff_does_not_block_ready_jobs(self):
+        scheduler = controller.Scheduler()
+        first, second = self.make_job("first"), self.make_job("second")
+        scheduler.submit(first)
+        scheduler.submit(second)
+        self.assertIs(scheduler.get(), first)
+        scheduler.requeue(first, 0.2)
+        self.assertIs(scheduler.get(), second)
+        scheduler.finish(second)
+        started = time.time()
+        self.assertIs(scheduler.get(), first)
+        self.assertGreaterEqual(time.time() - started, 0.1)
+        scheduler.finish(first)
+        self.assertIsNone(scheduler.get())
+
+class TestDashboard(unittest.TestCase):
+    class FakeLive:
+        def __init__(self):
+            self.updates = 0
+
+        def update(self, renderable, refresh=False):
+            self.updates += 1
+
+    def setUp(self):
+        controller.concurrency = controller.ConcurrencyController(2)
+        controller.project_status.clear()
+        for i in range(300):
+            controller.project_status[f"p{i:03d}"] = {"status": "Done" if i < 200 else "Pending", "step": "", "progress": 0}
+        controller.project_status["p250"]["status"] = "Running"
+
+    def tearDown(self):
+        controller.project_status.clear()
+
+    def test_large_batches_show_a_window(self):
+        table = controller.generate_table(max_rows=10)
+        self.assertEqual(table.row_count, 10)
+        self.assertEqual(controller.visible_projects(10)[0][0], "p250")
+        self.assertIn("Showing 10 of 300: Running 1, Pending 99, Done 200", table.caption)
+
+    def test_events_are_coalesced_into_frames(self):
+        live = self.FakeLive()
+        dashboard = controller.Dashboard(live, fps=20, max_rows=10).start()
+        for _ in range(5000):
+            dashboard.mark_dirty()
+        time.sleep(0.2)
+        dashboard.close()
+        self.assertLessEqual(live.updates, 6)
+        self.assertFalse(dashboard.dirty)
+
+    def test_headless_reports_changes_as_json_lines(self):
+        stream = io.StringIO()
+        reporter = controller.HeadlessReporter(stream, fps=100, summary_interval=3600)
+        reporter.render()
+        controller.project_status["p250"].update(status="Done", step="Task Completed Successfully")
+        reporter.render()
+        reporter.summary()
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(events), 302)
+        self.assertEqual(events[-2]["project"], "p250")
+        self.assertEqual(events[-1]["counts"], {"Done": 201, "Pending": 99})
+
+    def test_controller_does_not_import_rich(self):
+        result = subprocess.run([sys.executable, "-c", "import sys, controller; print('rich' in sys.modules)"],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(controller.__file__)))
+        self.assertEqual(result.stdout.strip(), "False")
+
+class TestSchedulingPolicy(unittest.TestCase):
+    def setUp(self):
+        self.db = os.path.abspath("test_policy.db")
+        self.store = StateStore(self.db)
+
+    def tearDown(self):
+        self.store.close()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.db + suffix):
+                os.remove(self.db + suffix)
+
+    def record(self, name, duration, outcome):
+        attempt_id = self.store.start_attempt(name, 1)
+        self.store.finish_attempt(attempt_id, 0, outcome)
+        with self.store._conn:
+            self.store._conn.execute("UPDATE attempts SET duration = ? WHERE id = ?", (duration, attempt_id))
+
+    def test_costs_from_history(self):
+        self.record("quick", 10, "done")
+        self.record("flaky", 10, "failed")
+        self.record("flaky", 10, "done")
+        self.record("slow", 100, "done")
+        self.record("slow", 5, "rate_limited")
+        stats = self.store.attempt_stats()
+        self.assertEqual(stats["slow"]["attempts"], 1)
+        costs = controller.estimate_costs(["quick", "flaky", "slow", "new"], stats)
+        self.assertEqual(costs["quick"], 15)
+        self.assertEqual(costs["flaky"], 20)
+        self.assertEqual(costs["new"], 20)  # median of the known projects
+
+    def test_priority_then_policy(self):
+        scheduler = controller.Scheduler()
+        costs = {"a": 30, "b": 10, "c": 20, "urgent": 99}
+        for name in ["a", "b", "c", "urgent"]:
+            project = {"name": name, "task": "t", "priority": 1 if name == "urgent" else 0}
+            job = controller.Job(project, "/tmp", ["gemini"])
+            job.rank = controller.job_rank(project, costs[name], "sjf")
+            scheduler.submit(job)
+        order = []
+        while True:
+            job = scheduler.get()
+            if job is None:
+                break
+            order.append(job.name)
+            scheduler.finish(job)
+        self.assertEqual(order, ["urgent", "b", "c", "a"])
+
+class TestTimeoutPolicy(unittest.TestCase):
+    def row(self, project, duration, outcome="done", max_idle=5):
+        return {"project": project, "duration": duration, "outcome": outcome, "max_idle": max_idle, "finished_at": 1}
+
+    def test_budget_sources(self):
+        history = [self.row("guess", 40), self.row("guess", 50, max_idle=20),
+                   self.row("maze", 200, "timed_out"),
+                   self.row("snake", 100), self.row("pong", 120), self.row("tetris", 400, "rate_limited")]
+        arcade = {"snake", "pong", "breakout"}
+        projects = [{"name": n, "class": "arcade" if n in arcade else None}
+                    for n in ["guess", "maze", "snake", "pong", "breakout", "new"]]
+        policy = TimeoutPolicy(history, projects, default_timeout=300, default_idle=120, pct=95)
+        timeout, idle, why = policy.budgets("guess")
+        self.assertEqual((timeout, idle), (75, 30))
+        self.assertIn("2 past run(s) of guess", why)
+        timeout, _, why = policy.budgets("maze")
+        self.assertEqual(timeout, 300)  # grown budget 200 * 1.5
+        self.assertIn("last attempt timed out", why)
+        # A class needs three samples; breakout falls through to all projects
+        timeout, _, why = policy.budgets("breakout")
+        self.assertEqual(timeout, 180)
+        self.assertIn("4 runs of all projects", why)
+        self.assertEqual(TimeoutPolicy([], projects, 300, 120).budgets("new")[:2], (300, 120))
+
+    def test_old_database_gains_max_idle(self):
+        path = os.path.abspath("test_old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE attempts (id INTEGER PRIMARY KEY AUTOINCREMENT, project TEXT NOT NULL, "
+                     "attempt INTEGER NOT NULL, started_at REAL NOT NULL, finished_at REAL, duration REAL, "
+                     "exit_code INTEGER, outcome TEXT)")
+        conn.close()
+        store = StateStore(path)
+        try:
+            store.finish_attempt(store.start_attempt("p", 1), 0, "done", max_idle=3.5)
+            self.assertEqual(store.attempt_history("p")[0]["max_idle"], 3.5)
+        finally:
+            store.close()
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+class TestProjectGraph(unittest.TestCase):
+    def test_order_and_critical_path(self):
+        projects = [{"name": "game", "depends_on": ["assets", "engine"]}, {"name": "engine", "depends_on": "assets"},
+                    {"name": "assets"}, {"name": "docs"}]
+        order, dependents = topological_order(projects)
+        self.assertLess(order.index("assets"), order.index("engine"))
+        self.assertLess(order.index("engine"), order.index("game"))
+        costs = {"game": 10, "engine": 5, "assets": 1, "docs": 100}
+        tail = downstream_costs(order, dependents, costs)
+        self.assertEqual(tail, {"game": 0, "engine": 10, "assets": 15, "docs": 0})
+
+    def test_invalid_graphs(self):
+        with self.assertRaisesRegex(ValueError, "unknown project 'nope'"):
+            topological_order([{"name": "a", "depends_on": ["nope"]}])
+        with self.assertRaisesRegex(ValueError, "cycle among 2 projects: b, c"):
+            topological_order([{"name": "a"}, {"name": "b", "depends_on": "c"}, {"name": "c", "depends_on": "b"}])
+        with self.assertRaisesRegex(ValueError, "Duplicate"):
+            topological_order([{"name": "a"}, {"name": "a"}])
+
+    def test_large_chain_validates_quickly(self):
+        projects = [{"name": "p0"}] + [{"name": f"p{i}", "depends_on": [f"p{i - 1}"]} for i in range(1, 20000)]
+        started = time.time()
+        order, _ = topological_order(projects)
+        self.assertEqual(order[-1], "p19999")
+        self.assertLess(time.time() - started, 1)
+
+def wait_gone(pid, timeout=5):
+    """True once pid has exited (a zombie awaiting its reaper counts as gone)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except OSError:
+            return True
+        time.sleep(0.05)
+    return False
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_supervisor")
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        self.original = (controller.PROJECTS_DIR, controller.LOG_FILE, os.environ["PATH"])
+        controller.PROJECTS_DIR = os.path.join(self.test_dir, "projects")
+        controller.LOG_FILE = os.path.join(self.test_dir, "controller.log")
+        install_fake_gemini(os.path.join(self.test_dir, "bin"))
+        controller.project_status.clear()
+        controller.concurrency = controller.ConcurrencyController(2)
+        controller.state_store = StateStore(os.path.join(self.test_dir, "state.db"))
+
+    def tearDown(self):
+        controller.PROJECTS_DIR, controller.LOG_FILE, os.environ["PATH"] = self.original
+        controller.project_status.clear()
+        controller.state_store.close()
+        controller.state_store = None
+        shutil.rmtree(self.test_dir)
+
+    def test_asyncio_supervisor(self):
+        projects = [{"name": f"p{i}", "task": "make a game"} for i in range(3)]
+        asyncio.run(controller.run_all_async(projects, lambda: None))
+        for p in projects:
+            self.assertEqual(controller.project_status[p["name"]]["status"], "Done")
+            self.assertTrue(controller.state_store.is_done(p["name"]))
+            self.assertEqual(controller.state_store.attempt_history(p["name"])[0]["outcome"], "done")
+
+    def test_threaded_supervisor(self):
+        projects = [{"name": f"p{i}", "task": "make a game"} for i in range(3)]
+        controller.run_all_threaded(projects, lambda: None)
+        for p in projects:
+            self.assertEqual(controller.project_status[p["name"]]["status"], "Done")
+        self.assertEqual(controller.concurrency.in_flight, 0)
+
+    def test_cache_hit_skips_agent(self):
+        controller.result_cache = ResultCache(os.path.join(self.test_dir, "cache"))
+        try:
+            projects = [{"name": "first", "task": "same game"}]
+            controller.run_all_threaded(projects, lambda: None)
+            # A failing agent proves the second project never launches one
+            install_fake_gemini(os.path.join(self.test_dir, "bin"), "#!/bin/sh\nexit 1\n")
+            controller.run_all_threaded([{"name": "second", "task": "same  game"}], lambda: None)
+        finally:
+            controller.result_cache = None
+        self.assertEqual(controller.project_status["second"]["step"], "Restored from cache")
+        self.assertEqual(controller.state_store.attempt_history("second"), [])
+        self.assertTrue(controller.verify_integrity(os.path.join(controller.PROJECTS_DIR, "second")))
+
+    def test_resume_skips_finished_and_keeps_retries(self):
+        projects = [{"name": n, "task": "t"} for n in ["done", "backoff", "fresh"]]
+        resume_state = {"run_id": "r1", "projects": projects, "limit": 1, "finished": {"done": "Done"},
+                        "retries": {"backoff": 2}, "not_before": {"backoff": time.time() + 60},
+                        "interrupted": set()}
+        scheduler = controller.build_scheduler(projects, lambda: None, resume_state)
+        self.assertEqual(controller.project_status["done"]["status"], "Done")
+        self.assertFalse(os.path.exists(os.path.join(controller.PROJECTS_DIR, "done")))
+        job = scheduler.get()
+        self.assertEqual(job.name, "fresh")
+        scheduler.finish(job)
+        with scheduler._cond:
+            self.assertEqual(scheduler._delayed[0][2].retries, 2)
+
+    def test_hedge_attempt_wins_and_is_promoted(self):
+        # Only the copy running in the hedge scratch directory ever finishes
+        script = "#!/bin/sh\ncase \"$(pwd -P)\" in\n*/.hedges/*)\n" + FAKE_GEMINI.split("\n", 1)[1] + ";;\n*) sleep 30;;\nesac\n"
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        controller.hedger = Hedger(pct=50, min_peers=1, budget=1, interval=0.1)
+        controller.hedger.record(0.2)
+        try:
+            started = time.time()
+            controller.run_all_threaded([{"name": "slow", "task": "make a game"}], lambda: None)
+        finally:
+            controller.hedger = None
+        self.assertLess(time.time() - started, 15)
+        self.assertEqual(controller.project_status["slow"]["status"], "Done")
+        self.assertTrue(controller.verify_integrity(os.path.join(controller.PROJECTS_DIR, "slow")))
+        self.assertEqual(os.listdir(controller.hedge_dir()), [])
+        outcomes = [a["outcome"] for a in controller.state_store.attempt_history("slow")]
+        self.assertEqual(sorted(outcomes), ["done", "hedge_won"])
+        self.assertEqual(controller.concurrency.in_flight, 0)
+
+    def test_dependencies_run_in_order_and_failures_skip_dependents(self):
+        script = "#!/bin/sh\ncase \"$(pwd -P)\" in\n*/broken) exit 1;;\nesac\n" + FAKE_GEMINI.split("\n", 1)[1]
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        projects = [{"name": "game", "task": "t", "depends_on": ["assets"]}, {"name": "assets", "task": "t"},
+                    {"name": "level", "task": "t", "depends_on": ["broken"]}, {"name": "broken", "task": "t"},
+                    {"name": "sequel", "task": "t", "depends_on": ["level", "game"]}]
+        controller.run_all_threaded(projects, lambda: None)
+        status = {name: info["status"] for name, info in controller.project_status.items()}
+        self.assertEqual(status, {"game": "Done", "assets": "Done", "broken": "Failed", "level": "Skipped",
+                                  "sequel": "Skipped"})
+        history = {p["name"]: controller.state_store.attempt_history(p["name"]) for p in projects}
+        self.assertGreaterEqual(history["game"][0]["started_at"], history["assets"][0]["finished_at"])
+        self.assertEqual(history["level"], [])
+        self.assertEqual(controller.state_store.get("sequel")["status"], "Skipped")
+        self.assertEqual(controller.concurrency.in_flight, 0)
+
+    def test_batch_splits_results_and_requeues_failures(self):
+        calls = os.path.join(self.test_dir, "calls")
+        script = ("#!/bin/sh\necho \"$PWD\" >> " + calls + "\n"
+                  "if ls -d */ >/dev/null 2>&1; then\n"
+                  "  for d in */; do [ \"$d\" = broken/ ] || printf '<html><body>%0200d</body></html>' 0 > \"$d/index.html\"; done\n"
+                  "else printf '<html><body>%0200d</body></html>' 0 > index.html; fi\n")
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        projects = [{"name": n, "task": "make a game"} for n in ("a", "b", "broken")]
+        projects.append({"name": "solo", "task": "make a big game", "batch": False})
+        original = controller.BATCH_SIZE
+        controller.BATCH_SIZE = 3
+        try:
+            asyncio.run(controller.run_all_async(projects, lambda: None))
+        finally:
+            controller.BATCH_SIZE = original
+        with open(calls) as f:
+            self.assertEqual(len(f.read().split()), 3)  # The batch, then broken and solo alone
+        for p in projects:
+            self.assertEqual(controller.project_status[p["name"]]["status"], "Done")
+            self.assertTrue(controller.verify_integrity(os.path.join(controller.PROJECTS_DIR, p["name"])))
+        outcomes = {p["name"]: [r["outcome"] for r in controller.state_store.attempt_history(p["name"])]
+                    for p in projects}
+        self.assertEqual(outcomes, {"a": ["batched"], "b": ["batched"], "broken": ["batch_failed", "done"],
+                                    "solo": ["done"]})
+        self.assertEqual(os.listdir(controller.batch_dir()), [])
+
+    def test_hedger_policy(self):
+        hedger = Hedger(pct=90, min_peers=3, budget=1)
+        hedger.record(10)
+        self.assertFalse(hedger.should_hedge(1000))
+        for d in [20, 30, 40, 50]:
+            hedger.record(d)
+        self.assertEqual(hedger.threshold(), 50)
+        self.assertFalse(hedger.should_hedge(45))
+        self.assertTrue(hedger.should_hedge(60))
+        self.assertTrue(hedger.claim())
+        self.assertFalse(hedger.claim())
+        self.assertFalse(hedger.should_hedge(60))
+
+    def test_silent_agent_hits_idle_timeout(self):
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), "#!/bin/sh\necho 'I will wait.'\nsleep 30\n")
+        controller.project_status["silent"] = {"status": "Running", "step": "", "progress": 0}
+        os.makedirs(controller.PROJECTS_DIR)
+        attempt = controller.AgentAttempt("silent", controller.PROJECTS_DIR, ["gemini"], lambda: None,
+                                          timeout=30, idle_timeout=0.5)
+        started = time.time()
+        controller.get_io_loop().run(attempt.run())
+        self.assertLess(time.time() - started, 10)
+        self.assertTrue(attempt.timed_out)
+        self.assertIn("No output", attempt.stop_reason)
+        self.assertEqual(controller.project_status["silent"]["status"], "Timed Out")
+
+    def test_verified_output_stops_agent_early(self):
+        script = FAKE_GEMINI + "while true; do echo 'Polishing...'; sleep 0.2; done\n"
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        controller.project_status["polish"] = {"status": "Running", "step": "", "progress": 0}
+        project_dir = os.path.join(controller.PROJECTS_DIR, "polish")
+        os.makedirs(project_dir)
+        attempt = controller.AgentAttempt("polish", project_dir, ["gemini"], lambda: None,
+                                          timeout=30, idle_timeout=30, early_stop_grace=0.5)
+        started = time.time()
+        controller.get_io_loop().run(attempt.run())
+        self.assertLess(time.time() - started, 10)
+        self.assertTrue(attempt.completed_early)
+        self.assertFalse(attempt.timed_out)
+        outcome = controller.resolve_attempt("polish", project_dir, attempt.timed_out, attempt.is_rate_limited,
+                                             attempt.returncode, completed_early=attempt.completed_early)
+        self.assertEqual(outcome, "done")
+        self.assertTrue(controller.state_store.is_done("polish"))
+
+    def test_timeout_kills_the_whole_tree(self):
+        # One child stays in the agent's group, one escapes it with setsid
+        script = "#!/bin/sh\nsleep 30 &\necho $! > pids\nsetsid sleep 30 &\necho $! >> pids\nsleep 30\n"
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        controller.project_status["tree"] = {"status": "Running", "step": "", "progress": 0}
+        os.makedirs(controller.PROJECTS_DIR)
+        attempt = controller.AgentAttempt("tree", controller.PROJECTS_DIR, ["gemini"], lambda: None,
+                                          timeout=1, idle_timeout=30)
+        controller.get_io_loop().run(attempt.run())
+        self.assertTrue(attempt.timed_out)
+        with open(os.path.join(controller.PROJECTS_DIR, "pids")) as f:
+            pids = [int(pid) for pid in f.read().split()]
+        self.assertEqual(len(pids), 2)
+        for pid in pids:
+            self.assertTrue(wait_gone(pid), pid)
+
+    def test_children_holding_pipes_do_not_delay_exit(self):
+        script = FAKE_GEMINI + "sleep 30 &\necho $! > pids\n"
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        controller.project_status["bg"] = {"status": "Running", "step": "", "progress": 0}
+        os.makedirs(controller.PROJECTS_DIR)
+        attempt = controller.AgentAttempt("bg", controller.PROJECTS_DIR, ["gemini"], lambda: None,
+                                          timeout=30, idle_timeout=30, early_stop_grace=0)
+        started = time.time()
+        controller.get_io_loop().run(attempt.run())
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(attempt.returncode, 0)
+        with open(os.path.join(controller.PROJECTS_DIR, "pids")) as f:
+            self.assertTrue(wait_gone(int(f.read())))
+
+    def test_large_stderr_does_not_block(self):
+        script = "#!/bin/sh\nhead -c 300000 /dev/zero | tr '\\0' x >&2\necho 'Resource exhausted' >&2\n"
+        install_fake_gemini(os.path.join(self.test_dir, "bin"), script)
+        controller.project_status["noisy"] = {"status": "Running", "step": "", "progress": 0}
+        os.makedirs(controller.PROJECTS_DIR)
+        attempt = controller.AgentAttempt("noisy", controller.PROJECTS_DIR, ["gemini"], lambda: None,
+                                          timeout=20, idle_timeout=20)
+        controller.get_io_loop().run(attempt.run())
+        self.assertFalse(attempt.timed_out)
+        self.assertEqual(attempt.returncode, 0)
+        self.assertTrue(attempt.is_rate_limited)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,82 @@
+from hedging import percentile
+
+TIMEOUT_PERCENTILE = 95  # Runtime percentile of successful attempts a budget is based on
+TIMEOUT_MARGIN = 1.5  # Headroom over that percentile
+TIMEOUT_GROWTH = 1.5  # Budget multiplier for a project whose last attempt timed out
+MIN_TIMEOUT = 60  # Bounds of a learned wall-clock budget, in seconds
+MAX_TIMEOUT = 900
+MIN_IDLE_TIMEOUT = 30  # Floor of a learned idle budget
+MIN_SAMPLES = 3  # Samples a class or the whole history needs before it is trusted
+
+SUCCESS_OUTCOMES = ("done", "hedge_won")
+IGNORED_OUTCOMES = ("rate_limited", "hedge_lost", "batched", "batch_failed")
+
+class TimeoutPolicy:
+    """Per-project wall-clock and idle-output budgets learned from past attempts.
+
+    A budget is the `pct` percentile of successful runtimes (or of the longest
+    silence within them) times `margin`. Samples come from the project itself,
+    else from projects of the same `class` in projects.json, else from every
+    project, else the configured defaults apply. A project whose last attempt
+    timed out gets at least `growth` times that attempt's runtime, so work that
+    was killed just short of finishing gets more room on the retry.
+    """
+
+    def __init__(self, history, projects, default_timeout, default_idle, pct=TIMEOUT_PERCENTILE,
+                 margin=TIMEOUT_MARGIN, growth=TIMEOUT_GROWTH, min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT):
+        self.default_timeout = default_timeout
+        self.default_idle = default_idle
+        self.pct = pct
+        self.margin = margin
+        self.growth = growth
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.classes = {p["name"]: p.get("class") for p in projects}
+        self.by_project = {}
+        for row in history:
+            if row["finished_at"] is not None and row["outcome"] not in IGNORED_OUTCOMES:
+                self.by_project.setdefault(row["project"], []).append(row)
+
+    def _samples(self, name, field):
+        """Successful samples of `field` and where they came from, most specific first."""
+        def successes(rows):
+            return sorted(r[field] for r in rows if r["outcome"] in SUCCESS_OUTCOMES and r[field] is not None)
+
+        own = successes(self.by_project.get(name, []))
+        if own:
+            return own, f"{len(own)} past run(s) of {name}"
+        cls = self.classes.get(name)
+        if cls is not None:
+            rows = [r for n, rs in self.by_project.items() if self.classes.get(n) == cls for r in rs]
+            peers = successes(rows)
+            if len(peers) >= MIN_SAMPLES:
+                return peers, f"{len(peers)} runs of class '{cls}'"
+        everyone = successes([r for rs in self.by_project.values() for r in rs])
+        if len(everyone) >= MIN_SAMPLES:
+            return everyone, f"{len(everyone)} runs of all projects"
+        return [], None
+
+    def budgets(self, name):
+        """Return (timeout, idle_timeout, explanation) for a project."""
+        durations, source = self._samples(name, "duration")
+        if durations:
+            timeout = percentile(durations, self.pct) * self.margin
+            timeout_source = f"p{self.pct:g} of {source}"
+        else:
+            timeout, timeout_source = self.default_timeout, "default"
+
+        rows = self.by_project.get(name)
+        if rows and rows[-1]["outcome"] == "timed_out" and rows[-1]["duration"]:
+            grown = rows[-1]["duration"] * self.growth
+            if grown > timeout:
+                timeout, timeout_source = grown, "last attempt timed out"
+        timeout = min(self.max_timeout, max(self.min_timeout, timeout))
+
+        silences, source = self._samples(name, "max_idle")
+        if silences:
+            idle = percentile(silences, self.pct) * self.margin
+            idle_source = f"p{self.pct:g} of {source}"
+        else:
+            idle, idle_source = self.default_idle, "default"
+        idle = min(timeout, max(MIN_IDLE_TIMEOUT, idle))
+        return timeout, idle, f"timeout {timeout:.0f}s ({timeout_source}), idle {idle:.0f}s ({idle_source})"